@@ -1,9 +1,12 @@
 import os
-import itertools
+import argparse
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from iv_2sls import load_processed_data, ensure_country_plots_dir, analyze_2sls_by_stage, plot_causal_effect
-from data.process.imputation import impute_data
+from spec_cache import SpecCache
+from spec_search import RESULT_COLUMNS, SpecSearch, control_combinations, run_specifications, specifications
+from data.process.imputation_cache import cached_impute_data
 
 
 def ensure_country_plots_dir(country):
@@ -23,10 +26,38 @@ def upscale_causal_effects(causal_effects, scaler, column):
     return causal_effects * std
 
 
-def grid_search(country, cup):
+def compare_with_ols(stages_df, results_df, outcome_var, treatment_var, rtol=1e-6, atol=1e-9):
+    """
+    Regression check of searched results against the statsmodels OLS pipeline of
+    `analyze_2sls_by_stage`, refitting every specification in `results_df` stage by stage.
+    Saturated stages, where the pipeline reports infinite standard errors, and stages whose
+    first stage is not identified (NaN F-statistic) are skipped; first-stage F-statistics
+    are compared through their p-values, since a perfect first stage leaves an F-statistic
+    of rounding noise.
+
+    Returns:
+    - pd.DataFrame: The rows that differ, with the pipeline's values suffixed '_ols'.
+    """
+    rows = []
+    for (grid_id, instr_var), spec_df in results_df.groupby(['grid_id', 'instrument'], sort=False):
+        control_vars = list(spec_df.iloc[0]['control_vars'])
+        ols_results, _ = analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_vars)
+        rows.extend(dict(result, grid_id=grid_id) for result in ols_results)
+
+    compared = results_df.merge(pd.DataFrame(rows), on=['grid_id', 'stage'], suffixes=('', '_ols'))
+    compared = compared[np.isfinite(compared['std_error_ols'].astype(float)) &
+                        compared['f_stat_ols'].notna()]
+    differs = np.zeros(len(compared), dtype=bool)
+    for col in ['2sls_iv', 'std_error', 'p_value', 'r_squared', 'f_p_value']:
+        differs |= ~np.isclose(compared[col].astype(float), compared[col + '_ols'].astype(float), rtol=rtol,
+                               atol=atol, equal_nan=True)
+    return compared[differs]
+
+
+def grid_search(country, cup, cov_type='plug_in', jobs=1, use_cache=True, check=False):
     # Load the processed DataFrame
     stages_df = load_processed_data(country, cup)
-    stages_df = impute_data(stages_df, method='drop')
+    stages_df = cached_impute_data(stages_df, country, method='drop')
 
     # Define variables for standardization
     all_vars = ['team_rank', 'opponent_rank_prev', 'rank_diff', 'distance', 'team_win',
@@ -46,48 +77,32 @@ def grid_search(country, cup):
                         'next_fixture_days']
 
     # Generate all combinations of control variables with 2, 3, 4, 5, 6, and 7 elements
-    control_var_combinations = []
-    for r in range(2, 8):
-        control_var_combinations.extend(itertools.combinations(all_control_vars, r))
-
-    results = []
-    grid_id = 0  # Initialize grid_id
-
-    for instr_var in instr_vars:
-        for control_var_combo in control_var_combinations:
-            # Ensure the instrument variable is not included in the control variables
-            if instr_var in control_var_combo:
-                continue
-
-            control_var_combo = list(control_var_combo)
-            grid_id += 1  # Increment grid_id for each combination
-            print(f'Testing: Outcome: {outcome_var} \n Instrument: {instr_var} \n Controls: {control_var_combo}, '
-                  f'Grid ID: {grid_id}')
-            result, _ = analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_var_combo,
-                                              display="")
-            for stage_result in result:
-                # Upscale the causal effect
-                stage_result['causal_effect'] = upscale_causal_effects(stage_result['2sls_iv'], scaler, treatment_var)
-
-                grid_var_combo = {
-                    'outcome_var': outcome_var,
-                    'instrument_var': instr_var,
-                    'treatment_var': treatment_var,
-                    'control_vars': control_var_combo,
-                    'grid_id': grid_id
-                }
-
-                # Add grid_id, instrument, and control_vars to the result
-                stage_result.update({
-                    'grid_id': grid_id,
-                    'instrument': instr_var,
-                    'control_vars': control_var_combo,
-                    'significant': (stage_result['f_stat'] > 10 and stage_result['f_p_value'] < 0.1 and stage_result[
-                        'p_value'] < 0.1)
-                })
-                results.append(stage_result)
-
-    results_df = pd.DataFrame(results)
+    control_var_combinations = control_combinations(all_control_vars, range(2, 8))
+
+    # Cross-products of all candidate variables per stage, shared by every specification.
+    # The default 'plug_in' standard errors are those of the two-OLS statsmodels pipeline.
+    search = SpecSearch(stages_df, outcome_var, treatment_var, instr_vars, all_control_vars)
+    # Results are cached per stage under a hash of the specification and of its data columns,
+    # so a rerun only fits the specifications that are not cached yet
+    specs = specifications(instr_vars, control_var_combinations)
+    cache = SpecCache.for_country(country) if use_cache else None
+    print(f'Testing {len(specs)} specifications of outcome {outcome_var} on {jobs} worker(s)')
+    results_df = run_specifications(search, specs, cov_type, jobs=jobs, cache=cache)
+
+    if check:
+        # Stages with constant or collinear controls must still match the two-OLS pipeline
+        mismatches = compare_with_ols(stages_df, results_df, outcome_var, treatment_var)
+        print(f'{len(mismatches)} stage results differ from the OLS pipeline')
+        if not mismatches.empty:
+            print(mismatches[['grid_id', 'stage', '2sls_iv', '2sls_iv_ols', 'std_error', 'std_error_ols']])
+
+    # Upscale the causal effect and flag significant stages
+    results_df['causal_effect'] = upscale_causal_effects(results_df['2sls_iv'], scaler, treatment_var)
+    results_df['significant'] = ((results_df['f_stat'] > 10) & (results_df['f_p_value'] < 0.1) &
+                                 (results_df['p_value'] < 0.1))
+    results_df = results_df[RESULT_COLUMNS + ['causal_effect', 'grid_id', 'instrument', 'control_vars',
+                                              'significant']]
+
     if not results_df.empty:
         results_df.to_csv(os.path.join(country_plots_dir, f'{outcome_var}_gridsearch_results.csv'), index=False)
 
@@ -102,6 +117,13 @@ def grid_search(country, cup):
             best_results = results_df[results_df['grid_id'] == grid]
             best_control_vars = best_results.iloc[0]['control_vars']
             best_instr_var = best_results.iloc[0]['instrument']
+            grid_var_combo = {
+                'outcome_var': outcome_var,
+                'instrument_var': best_instr_var,
+                'treatment_var': treatment_var,
+                'control_vars': best_control_vars,
+                'grid_id': grid
+            }
 
             print(f"Grid ID: {grid}")
             print(f"Instrument: {best_instr_var}")
@@ -111,15 +133,14 @@ def grid_search(country, cup):
                 print(
                     f"Stage: {row['stage']}, Causal Effect: {row['causal_effect']}, Std Error: {row['std_error']}, P-Value: {row['p_value']}, R-Squared: {row['r_squared']}, F-Stat: {row['f_stat']}, F P-Value: {row['f_p_value']}, Significant: {row['significant']}")
 
-            # Run the analysis again with the current best combination
-            best_result_analysis, best_summaries = analyze_2sls_by_stage(stages_df, outcome_var, best_instr_var,
-                                                                         treatment_var,
-                                                                         best_control_vars, display="summary plot")
+            # Run the analysis again with the current best combination for its regression summaries
+            _, best_summaries = analyze_2sls_by_stage(stages_df, outcome_var, best_instr_var, treatment_var,
+                                                      best_control_vars, display="summary plot")
 
-            # Save the plot with a unique filename
+            # Save the plot of the searched results with a unique filename
             plot_filename = f"{outcome_var}_grid_{grid}_instr_{best_instr_var}_controls_{'_'.join(best_control_vars)}.png"
-            plot_causal_effect(grid_var_combo, best_result_analysis, country_plots_dir, display="plot",
-                               filename=plot_filename)
+            plot_causal_effect(grid_var_combo, best_results[RESULT_COLUMNS].to_dict('records'), country_plots_dir,
+                               display="plot", filename=plot_filename)
 
             # Save the results for all stages
             result_filename = f"{outcome_var}_grid_{grid}_results.csv"
@@ -148,7 +169,12 @@ def grid_search(country, cup):
 
 
 if __name__ == "__main__":
-    country = 'Germany'
-    cup = 'DFB_Pokal'
-
-    grid_search(country, cup)
+    parser = argparse.ArgumentParser(description='2SLS grid search over instruments and control sets')
+    parser.add_argument('--country', default='Germany')
+    parser.add_argument('--cup', default='DFB_Pokal')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--no-cache', action='store_true', help='Refit every specification without the result cache')
+    parser.add_argument('--check', action='store_true', help='Compare the results with the statsmodels OLS pipeline')
+    args = parser.parse_args()
+
+    grid_search(args.country, args.cup, jobs=args.jobs, use_cache=not args.no_cache, check=args.check)
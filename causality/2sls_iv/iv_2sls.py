@@ -1,11 +1,15 @@
 import os
+import functools
+from collections.abc import Mapping
 import pandas as pd
 import textwrap
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 
 from utils.load import project_root
-from data.process.imputation import impute_data
+from data.process.imputation_cache import cached_impute_data
+from data.process.multiple_imputation import multiple_impute, estimate_imputed, pool_rubin
+from iv_engine import iv_2sls, iv_2sls_by_group
 
 
 def load_processed_data(country, cup):
@@ -19,7 +23,51 @@ def ensure_country_plots_dir(country):
     return country_plots_dir
 
 
-def perform_2sls_analysis(data, outcome_var, instr_var, treatment_var, control_vars, display="none"):
+def render_summary(model, fmt="text"):
+    """
+    Render the summary of a statsmodels or native 2SLS result as 'text' or 'latex'.
+    """
+    summary = model.summary()
+    if isinstance(summary, str):
+        # The native engine renders text itself; its LaTeX is the coefficient table
+        return summary if fmt == "text" else model.summary_frame().to_latex(float_format='%.4f')
+    return summary.as_text() if fmt == "text" else summary.as_latex()
+
+
+class StageSummary(Mapping):
+    """
+    Regression summaries of one stage, rendered from the fitted models only when read.
+    Reads like the {'first_stage_summary': ..., 'second_stage_summary': ...} dict of text
+    summaries; `as_latex` renders the LaTeX tables instead.
+    """
+
+    def __init__(self, first_stage_model, second_stage_model):
+        self.models = {'first_stage_summary': first_stage_model, 'second_stage_summary': second_stage_model}
+        self._text = {}
+
+    def __getitem__(self, key):
+        if key not in self._text:
+            model = self.models[key]
+            self._text[key] = render_summary(model) if model is not None else None
+        return self._text[key]
+
+    def __iter__(self):
+        return iter(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+    def as_latex(self, key):
+        model = self.models[key]
+        return render_summary(model, "latex") if model is not None else None
+
+
+def perform_2sls_analysis(data, outcome_var, instr_var, treatment_var, control_vars, display="none", estimator="ols",
+                          cov_type="homoskedastic", cluster_var=None):
+    if estimator == "native":
+        return perform_native_2sls_analysis(data, outcome_var, instr_var, treatment_var, control_vars, display,
+                                            cov_type, cluster_var)
+
     # First stage Regression
     X1 = sm.add_constant(data[[instr_var] + control_vars])
     first_stage_model = sm.OLS(data[treatment_var], X1).fit()
@@ -49,7 +97,75 @@ def perform_2sls_analysis(data, outcome_var, instr_var, treatment_var, control_v
     }
 
 
-def analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_vars, display="none"):
+def perform_native_2sls_analysis(data, outcome_var, instr_var, treatment_var, control_vars, display="none",
+                                 cov_type="homoskedastic", cluster_var=None):
+    """
+    2SLS with the NumPy engine: proper 2SLS standard errors ('homoskedastic', 'HC1' or
+    'cluster' on `cluster_var`) and no D_hat column added to `data`. The instrumented
+    treatment keeps the 'D_hat' label so results read like those of the OLS pipeline;
+    the R-squared is the 2SLS one, computed with the actual treatment.
+    """
+    model = iv_2sls(data, outcome_var, instr_var, treatment_var, control_vars, cov_type, cluster_var)
+    first_stage = model.first_stage[treatment_var]
+
+    if "summary" in display:
+        print('2SLS Summary:')
+        print(model.summary())
+
+    names = pd.Index(['D_hat'] + model.names[1:])
+    return {
+        'second_stage_model': model,
+        'first_stage_model': None,
+        'second_stage_params': pd.Series(model.params, index=names),
+        'second_stage_bse': pd.Series(model.bse, index=names),
+        'second_stage_pvalues': pd.Series(model.pvalues, index=names),
+        'second_stage_rsquared': model.rsquared,
+        'first_stage_fvalue': first_stage['f_stat'],
+        'first_stage_pvalue': first_stage['f_p_value'],
+    }
+
+
+def analyze_2sls_by_stage_native(stages_df, outcome_var, instr_var, treatment_var, control_vars, display="none",
+                                 cov_type="homoskedastic", cluster_var=None):
+    """
+    `analyze_2sls_by_stage` with the NumPy engine, fitting all stages in one grouped
+    call instead of filtering and fitting the frame stage by stage.
+    """
+    grouped = iv_2sls_by_group(stages_df, 'stage', outcome_var, instr_var, treatment_var, control_vars, cov_type,
+                               cluster_var)
+    first_stage = grouped.first_stage[treatment_var]
+    treatment = grouped.names.index(treatment_var)
+
+    results = []
+    summaries = {}
+    for i, stage in enumerate(grouped.groups):
+        model = grouped.result(i)
+        if "summary" in display:
+            print(f'Running Stage {stage}')
+            print('2SLS Summary:')
+            print(model.summary())
+
+        results.append({
+            'stage': stage,
+            '2sls_iv': grouped.params[i, treatment],
+            'std_error': grouped.bse[i, treatment],
+            'p_value': model.pvalues[treatment],
+            'r_squared': grouped.rsquared[i],
+            'f_stat': first_stage['f_stat'][i],
+            'f_p_value': first_stage['f_p_value'][i],
+        })
+        # The native engine reports both stages in one summary
+        summaries[stage] = StageSummary(None, model)
+
+    return results, summaries
+
+
+def analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_vars, display="none",
+                          estimator="ols", cov_type="homoskedastic", cluster_var=None):
+    if estimator == "native":
+        return analyze_2sls_by_stage_native(stages_df, outcome_var, instr_var, treatment_var, control_vars, display,
+                                            cov_type, cluster_var)
+
     unique_stages = stages_df['stage'].unique()
     unique_stages.sort()
 
@@ -72,14 +188,43 @@ def analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, cont
             'f_stat': analysis_result['first_stage_fvalue'],
             'f_p_value': analysis_result['first_stage_pvalue'],
         })
-        summaries[stage] = {
-            'first_stage_summary': analysis_result['first_stage_model'].summary().as_text(),
-            'second_stage_summary': analysis_result['second_stage_model'].summary().as_text()
-        }
+        # Summaries are rendered on first access; most callers only need the estimates
+        summaries[stage] = StageSummary(analysis_result['first_stage_model'],
+                                        analysis_result['second_stage_model'])
 
     return results, summaries
 
 
+def stage_estimates(stages_df, outcome_var, instr_var, treatment_var, control_vars, estimator="ols"):
+    results, _ = analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_vars,
+                                       estimator=estimator)
+    return results
+
+
+def analyze_2sls_by_stage_imputed(stages_df, outcome_var, instr_var, treatment_var, control_vars, m=20, workers=None,
+                                  seed=0, estimator="ols"):
+    """
+    2SLS by stage over M stochastic imputations of the non-league teams' financial data,
+    estimated in parallel and pooled with Rubin's rules, so the standard errors include
+    the imputation uncertainty.
+
+    Returns:
+    - list: Per stage the pooled '2sls_iv', 'std_error' and 'p_value', the mean 'r_squared',
+      'f_stat' and 'f_p_value' over the imputations, and the Rubin degrees of freedom and
+      fraction of missing information.
+    """
+    datasets = multiple_impute(stages_df, m=m, seed=seed)
+    estimator = functools.partial(stage_estimates, outcome_var=outcome_var, instr_var=instr_var,
+                                  treatment_var=treatment_var, control_vars=control_vars, estimator=estimator)
+    estimates = estimate_imputed(datasets, estimator, workers)
+
+    pooled = pool_rubin(estimates, ['stage'], estimate_col='2sls_iv', se_col='std_error')
+    fit_stats = estimates.groupby('stage')[['r_squared', 'f_stat', 'f_p_value']].mean().reset_index()
+    results = pooled.merge(fit_stats, on='stage')
+    return results[['stage', '2sls_iv', 'std_error', 'p_value', 'r_squared', 'f_stat', 'f_p_value', 'df',
+                    'missing_information']].to_dict('records')
+
+
 def plot_causal_effect(variables, results, country_plots_dir, display="none", filename="causal_effect_by_stage.png"):
     def format_controls(control_vars):
         # Split the control variables into chunks of 4 and join with line breaks
@@ -143,11 +288,14 @@ if __name__ == "__main__":
     country = 'Germany'
     cup = 'DFB_Pokal'
     display = " "  # Set to "summary plot" to display both summaries and plots
+    imputations = 0  # Set to e.g. 20 to pool the estimates over stochastic imputations
+    estimator = "ols"  # "native" for the 2SLS engine with proper 2SLS standard errors
 
     # Load the processed DataFrame
     stages_df = load_processed_data(country, cup)
 
-    stages_df = impute_data(stages_df, method='minmax')
+    if not imputations:
+        stages_df = cached_impute_data(stages_df, country, method='minmax')
 
     # Ensure country-specific plots directory exists
     country_plots_dir = ensure_country_plots_dir(country)
@@ -159,7 +307,12 @@ if __name__ == "__main__":
     control_vars = ['team_rank_prev', 'team_size', 'foreigners', 'mean_age', 'mean_value', 'total_value', 'distance']
 
     # Perform the 2SLS analysis by stage
-    results, summaries = analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_vars, display)
+    if imputations:
+        results = analyze_2sls_by_stage_imputed(stages_df, outcome_var, instr_var, treatment_var, control_vars,
+                                                m=imputations, estimator=estimator)
+    else:
+        results, summaries = analyze_2sls_by_stage(stages_df, outcome_var, instr_var, treatment_var, control_vars,
+                                                   display, estimator)
 
     # Plot the causal effect for all rounds
     plot_causal_effect(results, country_plots_dir, display)
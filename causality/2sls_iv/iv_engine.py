@@ -0,0 +1,449 @@
+import numpy as np
+import pandas as pd
+from scipy import special
+
+COV_TYPES = ('homoskedastic', 'HC1', 'cluster')
+
+# Relative eigenvalue of a cross-product matrix (squared singular value of a design matrix)
+# below which a direction counts as collinear
+RANK_TOLERANCE = 1e-12
+
+
+def design_matrices(data, outcome_var, instr_vars, treatment_vars, control_vars, cluster_var=None):
+    """
+    Pull the arrays of a 2SLS fit out of a DataFrame without modifying it. A constant is
+    prepended to the exogenous controls.
+
+    Returns:
+    - tuple: (y, D, Z, W, clusters) with D the endogenous regressors, Z the excluded
+      instruments and W the exogenous regressors.
+    """
+    # Stack the columns one by one; selecting a column list first copies every block of a mixed-dtype frame
+    k_d, k_z = len(treatment_vars), len(instr_vars)
+    columns = [outcome_var] + list(treatment_vars) + list(instr_vars) + list(control_vars)
+    values = np.column_stack([data[col].to_numpy(dtype=float) for col in columns])
+    y = values[:, 0]
+    D = values[:, 1:1 + k_d]
+    Z = values[:, 1 + k_d:1 + k_d + k_z]
+    W = np.column_stack([np.ones(len(values)), values[:, 1 + k_d + k_z:]])
+    clusters = data[cluster_var].to_numpy() if cluster_var is not None else None
+    return y, D, Z, W, clusters
+
+
+def _projection_basis(A):
+    # Orthonormal basis of the column space of A, dropping dependent columns like a pseudo-inverse would
+    U, singular_values, _ = np.linalg.svd(A, full_matrices=False)
+    rank = singular_values ** 2 > singular_values.max() ** 2 * RANK_TOLERANCE
+    return U[:, rank]
+
+
+def _rss(Q, v):
+    # Residual sum of squares of v after projecting on the orthonormal columns Q
+    residual = v - Q @ (Q.T @ v)
+    return np.einsum('ij,ij->j', residual, residual)
+
+
+def _covariance(X_hat, bread, u, cov_type, clusters, df_resid):
+    n, k = X_hat.shape
+    if df_resid <= 0:
+        # A saturated fit leaves no residual variance to estimate
+        return np.full((k, k), np.nan)
+    if cov_type == 'homoskedastic':
+        return bread * (u @ u / df_resid)
+    if cov_type == 'HC1':
+        meat = (X_hat * u[:, None] ** 2).T @ X_hat
+        return bread @ meat @ bread * (n / df_resid)
+    if cov_type == 'cluster':
+        if clusters is None:
+            raise ValueError("Clustered standard errors need a cluster variable")
+        _, group = np.unique(clusters, return_inverse=True)
+        n_clusters = group.max() + 1
+        scores = np.zeros((n_clusters, k))
+        np.add.at(scores, group, X_hat * u[:, None])
+        correction = n_clusters / (n_clusters - 1) * (n - 1) / df_resid
+        return bread @ (scores.T @ scores) @ bread * correction
+    raise ValueError(f"Unknown cov_type '{cov_type}', expected one of {COV_TYPES}")
+
+
+class IVResults:
+    """
+    Result of a 2SLS fit. Coefficients, standard errors and test statistics are NumPy
+    arrays ordered like `names`: the endogenous regressors, 'const' and the controls.
+    `first_stage` holds per endogenous regressor the coefficients of the excluded
+    instruments, the R², the F-statistic of the first-stage regression and the partial
+    F-statistic of the excluded instruments.
+    """
+
+    def __init__(self, names, params, cov, df_inference, nobs, df_resid, rsquared, cov_type, first_stage):
+        self.names = names
+        self.params = params
+        self.cov = cov
+        self.bse = np.sqrt(np.diag(cov))
+        self.tvalues = params / self.bse
+        self.pvalues = 2 * special.stdtr(df_inference, -np.abs(self.tvalues))
+        self.nobs = nobs
+        self.df_resid = df_resid
+        self.rsquared = rsquared
+        self.cov_type = cov_type
+        self.first_stage = first_stage
+
+    def coefficient(self, name):
+        i = self.names.index(name)
+        return {'coef': self.params[i], 'std_error': self.bse[i], 't_value': self.tvalues[i],
+                'p_value': self.pvalues[i]}
+
+    def summary_frame(self):
+        return pd.DataFrame({'coef': self.params, 'std_error': self.bse, 't_value': self.tvalues,
+                             'p_value': self.pvalues}, index=self.names)
+
+    def summary(self):
+        lines = [f'2SLS estimates ({self.cov_type} standard errors), {self.nobs} observations, '
+                 f'R-squared: {self.rsquared:.3f}',
+                 self.summary_frame().to_string(float_format=lambda value: f'{value:.4f}'),
+                 '',
+                 'First stage:',
+                 pd.DataFrame(self.first_stage).T.drop(columns=['instrument_params'])
+                 .to_string(float_format=lambda value: f'{value:.4f}')]
+        return '\n'.join(lines)
+
+
+def fit_2sls(y, D, Z, W, cov_type='homoskedastic', clusters=None, names=None):
+    """
+    Two-stage least squares with SVD projections. The endogenous regressors D are
+    projected on an orthonormal basis of the instrument set [Z, W]; the second stage
+    regresses y on the projections through an SVD pseudo-inverse, and its residuals
+    use the actual D, so the standard errors are the proper 2SLS ones rather than
+    those of the plug-in second-stage OLS.
+
+    Collinear regressors get the minimum-norm coefficients, as the pseudo-inverse of
+    statsmodels gives, and the degrees of freedom count the rank of the design instead
+    of its columns. First-stage F-statistics are NaN when the instruments leave no
+    residual degrees of freedom, or when the instruments add nothing to the constant or
+    to the exogenous regressors.
+
+    Parameters:
+    - y: Outcome (n,).
+    - D: Endogenous regressors (n, k_d).
+    - Z: Excluded instruments (n, k_z), with k_z >= k_d.
+    - W: Exogenous regressors including the constant (n, k_w).
+    - cov_type: 'homoskedastic', 'HC1' or 'cluster' (with `clusters` labels).
+    - names: Names of the columns of [D, W].
+
+    Returns:
+    - IVResults: Second-stage estimates with first-stage diagnostics.
+    """
+    D = np.asarray(D, dtype=float).reshape(len(y), -1)
+    Z = np.asarray(Z, dtype=float).reshape(len(y), -1)
+    W = np.asarray(W, dtype=float).reshape(len(y), -1)
+    X = np.column_stack([D, W])
+    if not (np.isfinite(y).all() and np.isfinite(X).all() and np.isfinite(Z).all()):
+        raise ValueError("The data contain NaNs or infinite values")
+
+    n, k = X.shape
+    k_d = D.shape[1]
+
+    # First stage: project the endogenous regressors on all instruments
+    Q_instruments = _projection_basis(np.column_stack([Z, W]))
+    Q_exogenous = _projection_basis(W)
+    D_hat = Q_instruments @ (Q_instruments.T @ D)
+    X_hat = np.column_stack([D_hat, W])
+
+    # Second stage on the projections, with residuals from the actual regressors; the
+    # pseudo-inverse drops the directions of collinear regressors
+    U, singular_values, Vt = np.linalg.svd(X_hat, full_matrices=False)
+    rank = singular_values ** 2 > singular_values.max() ** 2 * RANK_TOLERANCE
+    V = Vt[rank].T
+    params = V @ (U[:, rank].T @ y / singular_values[rank])
+    u = y - X @ params
+    bread = (V / singular_values[rank] ** 2) @ V.T
+    df_resid = n - rank.sum()
+    cov = _covariance(X_hat, bread, u, cov_type, clusters, df_resid)
+    df_inference = len(np.unique(clusters)) - 1 if cov_type == 'cluster' else df_resid
+    rsquared = 1 - u @ u / np.sum((y - y.mean()) ** 2)
+
+    # First-stage diagnostics per endogenous regressor
+    rank_full, rank_exogenous = Q_instruments.shape[1], Q_exogenous.shape[1]
+    tss = np.sum((D - D.mean(axis=0)) ** 2, axis=0)
+    # Rounding can push a (near) perfect fit below zero or above the total sum of squares
+    rss_full = np.clip(_rss(Q_instruments, D), 0, tss)
+    rss_exogenous = np.clip(_rss(Q_exogenous, D), rss_full, tss)
+    df_first = n - rank_full
+    instrument_params = np.linalg.lstsq(np.column_stack([Z, W]), D, rcond=None)[0][:Z.shape[1]]
+    names = names or [f'x{i}' for i in range(k)]
+    first_stage = {}
+    for j in range(k_d):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f_stat = ((tss[j] - rss_full[j]) / (rank_full - 1)) / (rss_full[j] / df_first)
+            partial_f = ((rss_exogenous[j] - rss_full[j]) / (rank_full - rank_exogenous)) / (rss_full[j] / df_first)
+        if df_first <= 0 or rank_full <= 1:
+            f_stat = np.nan
+        if df_first <= 0 or rank_full <= rank_exogenous:
+            partial_f = np.nan
+        first_stage[names[j]] = {
+            'instrument_params': instrument_params[:, j],
+            'r_squared': 1 - rss_full[j] / tss[j] if tss[j] > 0 else np.nan,
+            'f_stat': f_stat,
+            'f_p_value': special.fdtrc(rank_full - 1, df_first, f_stat),
+            'partial_f_stat': partial_f,
+            'partial_f_p_value': special.fdtrc(rank_full - rank_exogenous, df_first, partial_f),
+        }
+
+    return IVResults(names, params, cov, df_inference, n, df_resid, rsquared, cov_type, first_stage)
+
+
+def iv_2sls(data, outcome_var, instr_vars, treatment_vars, control_vars, cov_type='homoskedastic', cluster_var=None):
+    """
+    Fit 2SLS on the columns of a DataFrame; see `fit_2sls`. The DataFrame is not modified.
+    """
+    instr_vars = [instr_vars] if isinstance(instr_vars, str) else list(instr_vars)
+    treatment_vars = [treatment_vars] if isinstance(treatment_vars, str) else list(treatment_vars)
+    y, D, Z, W, clusters = design_matrices(data, outcome_var, instr_vars, treatment_vars, control_vars, cluster_var)
+    return fit_2sls(y, D, Z, W, cov_type, clusters, names=treatment_vars + ['const'] + list(control_vars))
+
+
+class GroupedIVResults:
+    """
+    2SLS results of several groups fitted together: arrays with a leading group axis,
+    aligned with `groups`. `result(i)` gives the IVResults of the i-th group.
+    """
+
+    def __init__(self, groups, names, params, cov, df_inference, nobs, df_resid, rsquared, cov_type, first_stage):
+        self.groups = groups
+        self.names = names
+        self.params = params
+        self.cov = cov
+        self.bse = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        self.df_inference = df_inference
+        self.nobs = nobs
+        self.df_resid = df_resid
+        self.rsquared = rsquared
+        self.cov_type = cov_type
+        self.first_stage = first_stage
+
+    def __len__(self):
+        return len(self.groups)
+
+    def result(self, i):
+        first_stage = {name: {key: values[i] for key, values in diagnostics.items()}
+                       for name, diagnostics in self.first_stage.items()}
+        return IVResults(self.names, self.params[i], self.cov[i], self.df_inference[i], self.nobs[i],
+                         self.df_resid[i], self.rsquared[i], self.cov_type, first_stage)
+
+
+def _symmetric_pinv(M):
+    # Pseudo-inverse, rank and null-space basis (zero columns for the kept directions) of
+    # stacked symmetric positive semi-definite matrices
+    eigenvalues, V = np.linalg.eigh(M)
+    kept = eigenvalues > np.maximum(eigenvalues[..., -1:], 0) * RANK_TOLERANCE
+    inverse = np.divide(1, eigenvalues, out=np.zeros_like(eigenvalues), where=kept)
+    pinv = (V * inverse[..., None, :]) @ np.swapaxes(V, -1, -2)
+    return pinv, kept.sum(axis=-1), V * ~kept[..., None, :]
+
+
+def _grouped_sums(values, starts):
+    # Sum the rows of every group of a group-sorted array in one pass
+    return np.add.reduceat(values, starts, axis=0)
+
+
+class CrossProducts:
+    """
+    Per-group cross-products S_g = A_g'A_g of a design matrix A, summed in a single pass
+    over the group-sorted rows. Columns are scaled to a maximum absolute value of one so
+    the products stay well conditioned. Any 2SLS specification whose outcome, regressors
+    and instruments are columns of A can be fitted for all groups from sub-matrices of S
+    (see `fit_2sls`), without going back to the rows unless robust standard errors are
+    requested.
+    """
+
+    def __init__(self, A, groups, clusters=None):
+        A = np.asarray(A, dtype=float)
+        if not np.isfinite(A).all():
+            raise ValueError("The data contain NaNs or infinite values")
+
+        self.scale = np.abs(A).max(axis=0)
+        self.scale[self.scale == 0] = 1
+
+        self.groups, group = np.unique(groups, return_inverse=True)
+        order = np.argsort(group, kind='stable')
+        self.A = A[order] / self.scale
+        self.group = group[order]
+        self.clusters = np.unique(np.asarray(clusters)[order], return_inverse=True)[1] if clusters is not None else None
+        self.nobs = np.bincount(self.group)
+        self.starts = np.concatenate([[0], np.cumsum(self.nobs)[:-1]])
+        self.S = _grouped_sums(self.A[:, :, None] * self.A[:, None, :], self.starts)
+
+    # Numeric arrays that fully describe the cross-products, e.g. to share them between processes
+    ARRAYS = ('scale', 'A', 'group', 'clusters', 'nobs', 'starts', 'S')
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS if getattr(self, name) is not None}
+
+    @classmethod
+    def from_arrays(cls, groups, arrays):
+        cross_products = cls.__new__(cls)
+        cross_products.groups = groups
+        for name in cls.ARRAYS:
+            setattr(cross_products, name, arrays.get(name))
+        return cross_products
+
+    def block(self, rows, columns):
+        return self.S[:, np.asarray(rows)[:, None], np.asarray(columns)]
+
+    def fit_2sls(self, outcome, endogenous, excluded, exogenous, cov_type='homoskedastic', names=None):
+        """
+        2SLS of every group for the given column indices of A. `exogenous` must start
+        with a constant column. Besides 'homoskedastic', 'HC1' and 'cluster', cov_type
+        'plug_in' reproduces the statsmodels two-OLS pipeline: residuals, R-squared and
+        standard errors of the second-stage OLS on the projected regressors.
+
+        As in `fit_2sls`, collinear regressors within a group (e.g. a control that is
+        constant in one stage) get the minimum-norm coefficients in the units of the
+        data, and the residual degrees of freedom count the rank of the design. Groups
+        without residual degrees of freedom get NaN standard errors, and their first-stage
+        F-statistics are NaN, as are those of groups whose instruments add nothing to the
+        constant or the exogenous regressors. A perfect first stage gives an infinite F.
+
+        Returns:
+        - GroupedIVResults: Results per group, in the sorted order of the group labels.
+        """
+        endogenous, excluded, exogenous = np.asarray(endogenous), np.asarray(excluded), np.asarray(exogenous)
+        instruments = np.concatenate([excluded, exogenous])
+        regressors = np.concatenate([endogenous, exogenous])
+        k_d, k_z, k = len(endogenous), len(excluded), len(endogenous) + len(exogenous)
+        S, nobs, scale = self.S, self.nobs, self.scale
+        n_groups = len(self.groups)
+
+        # First stage: projection coefficients of the regressors on the instruments
+        S_instruments = self.block(instruments, instruments)
+        instruments_pinv, rank_full, _ = _symmetric_pinv(S_instruments)
+        projection = instruments_pinv @ self.block(instruments, regressors)
+
+        # Second stage on the projected regressors
+        projected_outcome = np.einsum('gqk,gq->gk', projection, S[:, instruments, outcome])
+        bread, rank, null = _symmetric_pinv(self.block(regressors, instruments) @ projection)
+        params = np.einsum('gkl,gl->gk', bread, projected_outcome)
+        if (rank < k).any():
+            # Move along the null space to the minimum-norm coefficients of the unscaled data,
+            # which the column scaling would otherwise change
+            unscaled_null = null / scale[regressors][:, None]
+            P = np.eye(k) - null @ np.linalg.pinv(unscaled_null) / scale[regressors]
+            params = np.einsum('gkl,gl->gk', P, params)
+            bread = P @ bread @ np.swapaxes(P, 1, 2)
+        if cov_type == 'plug_in':
+            rss = S[:, outcome, outcome] - np.einsum('gk,gk->g', params, projected_outcome)
+        else:
+            rss = (S[:, outcome, outcome] - 2 * np.einsum('gk,gk->g', params, S[:, regressors, outcome])
+                   + np.einsum('gk,gkl,gl->g', params, self.block(regressors, regressors), params))
+        df_resid = nobs - rank
+        # Saturated groups leave no residual variance to estimate
+        df_variance = np.where(df_resid > 0, df_resid, np.nan)
+
+        if cov_type in ('homoskedastic', 'plug_in'):
+            cov = bread * (rss / df_variance)[:, None, None]
+            df_inference = df_resid
+        else:
+            # Robust covariances need the residuals and projected regressors of every row
+            X_hat = np.einsum('iq,iqk->ik', self.A[:, instruments], projection[self.group])
+            u = self.A[:, outcome] - np.einsum('ik,ik->i', self.A[:, regressors], params[self.group])
+            scores = X_hat * u[:, None]
+            if cov_type == 'HC1':
+                meat = _grouped_sums(scores[:, :, None] * scores[:, None, :], self.starts)
+                cov = bread @ meat @ bread * (nobs / df_variance)[:, None, None]
+                df_inference = df_resid
+            elif cov_type == 'cluster':
+                if self.clusters is None:
+                    raise ValueError("Clustered standard errors need a cluster variable")
+                _, cluster = np.unique(self.clusters, return_inverse=True)
+                n_clusters = cluster.max() + 1
+                cell = self.group * n_clusters + cluster
+                cluster_scores = np.zeros((n_groups * n_clusters, k))
+                np.add.at(cluster_scores, cell, scores)
+                cluster_scores = cluster_scores.reshape(n_groups, n_clusters, k)
+                clusters_per_group = (np.bincount(cell, minlength=n_groups * n_clusters)
+                                      .reshape(n_groups, n_clusters) > 0).sum(axis=1)
+                correction = clusters_per_group / (clusters_per_group - 1) * (nobs - 1) / df_variance
+                cov = bread @ np.einsum('gck,gcl->gkl', cluster_scores, cluster_scores) @ bread \
+                    * correction[:, None, None]
+                df_inference = clusters_per_group - 1
+            else:
+                raise ValueError(f"Unknown cov_type '{cov_type}', expected one of {COV_TYPES}")
+
+        constant = exogenous[0]
+        rsquared = 1 - rss / (S[:, outcome, outcome] - S[:, outcome, constant] ** 2 / nobs)
+
+        # Undo the column scaling
+        params = params * scale[outcome] / scale[regressors]
+        cov = cov * scale[outcome] ** 2 / np.outer(scale[regressors], scale[regressors])
+
+        # First-stage diagnostics per endogenous regressor
+        S_exogenous = self.block(exogenous, exogenous)
+        exogenous_pinv, rank_exogenous, _ = _symmetric_pinv(S_exogenous)
+        S_endogenous = np.diagonal(self.block(endogenous, endogenous), axis1=1, axis2=2)
+        tss = S_endogenous - S[:, endogenous, constant] ** 2 / nobs[:, None]
+        # Rounding can push a (near) perfect fit below zero or above the total sum of squares; the
+        # differences of cross-products only resolve residuals down to the rank tolerance
+        rss_full = np.clip(S_endogenous - np.einsum('gqj,gqj->gj', self.block(instruments, endogenous),
+                                                    projection[:, :, :k_d]), 0, tss)
+        rss_full[rss_full <= S_endogenous * RANK_TOLERANCE] = 0
+        exogenous_projection = exogenous_pinv @ self.block(exogenous, endogenous)
+        rss_exogenous = np.clip(S_endogenous - np.einsum('gwj,gwj->gj', self.block(exogenous, endogenous),
+                                                         exogenous_projection), rss_full, tss)
+        df_first = (nobs - rank_full)[:, None]
+        df_model = (rank_full - 1)[:, None]
+        df_excluded = (rank_full - rank_exogenous)[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f_stat = ((tss - rss_full) / df_model) / (rss_full / df_first)
+            partial_f = ((rss_exogenous - rss_full) / df_excluded) / (rss_full / df_first)
+            r_squared = 1 - rss_full / tss
+        # Unidentified first stages: no residual degrees of freedom, or instruments that add nothing
+        f_stat[(df_first <= 0) | (df_model <= 0) | (tss <= 0)] = np.nan
+        partial_f[(df_first <= 0) | (df_excluded <= 0) | (tss <= 0)] = np.nan
+        r_squared[tss <= 0] = np.nan
+        instrument_params = projection[:, :k_z, :k_d] * scale[endogenous] / scale[excluded, None]
+
+        names = names or [f'x{i}' for i in range(k)]
+        first_stage = {names[j]: {
+            'instrument_params': instrument_params[:, :, j],
+            'r_squared': r_squared[:, j],
+            'f_stat': f_stat[:, j],
+            'f_p_value': special.fdtrc(df_model[:, 0], df_first[:, 0], f_stat[:, j]),
+            'partial_f_stat': partial_f[:, j],
+            'partial_f_p_value': special.fdtrc(df_excluded[:, 0], df_first[:, 0], partial_f[:, j]),
+        } for j in range(k_d)}
+
+        return GroupedIVResults(self.groups, names, params, cov, df_inference, nobs, df_resid, rsquared, cov_type,
+                                first_stage)
+
+
+def fit_2sls_grouped(y, D, Z, W, groups, cov_type='homoskedastic', clusters=None, names=None):
+    """
+    2SLS of every group at once, e.g. every stage of a cup. The design matrix [y, D, Z, W]
+    is built once and the cross-products of all groups are summed in a single pass over
+    the group-sorted rows; each group's fit then only solves small (k x k) systems. The
+    estimates are those of `fit_2sls` on each group separately.
+
+    Returns:
+    - GroupedIVResults: Results per group, in the sorted order of the group labels.
+    """
+    y = np.asarray(y, dtype=float)
+    D = np.asarray(D, dtype=float).reshape(len(y), -1)
+    Z = np.asarray(Z, dtype=float).reshape(len(y), -1)
+    W = np.asarray(W, dtype=float).reshape(len(y), -1)
+    k_d, k_z, k_w = D.shape[1], Z.shape[1], W.shape[1]
+
+    cross_products = CrossProducts(np.column_stack([y, D, Z, W]), groups, clusters)
+    return cross_products.fit_2sls(0, np.arange(1, 1 + k_d), np.arange(1 + k_d, 1 + k_d + k_z),
+                                   np.arange(1 + k_d + k_z, 1 + k_d + k_z + k_w), cov_type, names)
+
+
+def iv_2sls_by_group(data, group_var, outcome_var, instr_vars, treatment_vars, control_vars, cov_type='homoskedastic',
+                     cluster_var=None):
+    """
+    Fit 2SLS on the columns of a DataFrame for every value of `group_var` in one call;
+    see `fit_2sls_grouped`. The DataFrame is not modified.
+    """
+    instr_vars = [instr_vars] if isinstance(instr_vars, str) else list(instr_vars)
+    treatment_vars = [treatment_vars] if isinstance(treatment_vars, str) else list(treatment_vars)
+    y, D, Z, W, clusters = design_matrices(data, outcome_var, instr_vars, treatment_vars, control_vars, cluster_var)
+    return fit_2sls_grouped(y, D, Z, W, data[group_var].to_numpy(), cov_type, clusters,
+                            names=treatment_vars + ['const'] + list(control_vars))
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.load import project_root
+
+# Bump when the estimator changes its results, so stale entries are not reused
+SPEC_CACHE_VERSION = 3
+
+# Per-stage result fields stored for every specification
+CACHED_FIELDS = ['2sls_iv', 'std_error', 'p_value', 'r_squared', 'f_stat', 'f_p_value']
+
+
+def column_digests(data, columns):
+    """
+    Hash of every column a specification may read, so a specification's fingerprint covers
+    only its own columns and adding a candidate control leaves existing keys unchanged.
+    Rows are hashed in order.
+    """
+    digests = {}
+    for col in dict.fromkeys(columns):
+        digest = hashlib.sha256(str(data[col].dtype).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(data[col], index=False).to_numpy().tobytes())
+        digests[col] = digest.hexdigest()
+    return digests
+
+
+def spec_key(digests, outcome_var, instr_var, treatment_var, control_vars, group_var, stage, estimator,
+             cluster_var=None):
+    """
+    Stable hash of one (dataset, outcome, instrument, treatment, controls, stage, estimator)
+    result. Controls are a set, so their order does not enter the key.
+    """
+    control_vars = sorted(control_vars)
+    columns = [outcome_var, instr_var, treatment_var, group_var] + control_vars
+    if cluster_var is not None:
+        columns.append(cluster_var)
+    payload = {
+        'version': SPEC_CACHE_VERSION,
+        'estimator': estimator,
+        'data': {col: digests[col] for col in columns},
+        'outcome': outcome_var,
+        'instrument': instr_var,
+        'treatment': treatment_var,
+        'controls': control_vars,
+        'stage': stage.item() if isinstance(stage, np.generic) else stage,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SpecCache:
+    """
+    Append-only store of per-stage specification results, one JSON line per result keyed
+    by its `spec_key`. Results are appended as chunks finish, so an interrupted search
+    keeps everything fitted so far; a partially written last line is ignored on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._torn = False
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                content = file.read()
+            for line in content.splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[entry['key']] = entry
+            # An interrupted write leaves a line without its newline; start the next one cleanly
+            self._torn = bool(content) and not content.endswith('\n')
+
+    @classmethod
+    def for_country(cls, country, name='specs', root=None):
+        root = root or os.path.join(project_root(), 'causality', '2sls_iv', 'cache')
+        return cls(os.path.join(root, country, f'{name}.jsonl'))
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries[key]
+
+    def store(self, entries):
+        entries = [entry for entry in entries if entry['key'] not in self.entries]
+        if not entries:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as file:
+            if self._torn:
+                file.write('\n')
+                self._torn = False
+            for entry in entries:
+                file.write(json.dumps(entry) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        self.entries.update((entry['key'], entry) for entry in entries)
@@ -0,0 +1,225 @@
+import copy
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+from iv_engine import CrossProducts
+from spec_cache import CACHED_FIELDS, column_digests, spec_key
+from utils.progress import ProgressBar
+from utils.shared_arrays import SharedArrays, attach_arrays
+
+RESULT_COLUMNS = ['stage', '2sls_iv', 'std_error', 'p_value', 'r_squared', 'f_stat', 'f_p_value']
+
+
+def control_combinations(control_vars, sizes=range(2, 8)):
+    combinations = []
+    for r in sizes:
+        combinations.extend(list(combination) for combination in itertools.combinations(control_vars, r))
+    return combinations
+
+
+def specifications(instr_vars, control_sets):
+    """
+    Enumerate (grid_id, instrument, controls) specifications, skipping control sets that
+    contain the instrument. Grid ids count from 1 in enumeration order.
+    """
+    specs = []
+    for instr_var in instr_vars:
+        for controls in control_sets:
+            if instr_var in controls:
+                continue
+            specs.append((len(specs) + 1, instr_var, list(controls)))
+    return specs
+
+
+class SpecSearch:
+    """
+    2SLS specification search over instruments and control sets. The cross-products of
+    the outcome, the treatment, every candidate instrument, a constant and every candidate
+    control are computed once per stage; each specification is then fitted for all
+    stages from the sub-matrices of its columns, so a grid costs a few small matrix
+    solves per specification instead of two OLS fits per stage.
+    """
+
+    def __init__(self, data, outcome_var, treatment_var, instr_vars, control_vars, group_var='stage',
+                 cluster_var=None):
+        self.outcome_var = outcome_var
+        self.treatment_var = treatment_var
+        self.instr_vars = list(instr_vars)
+        self.control_vars = [col for col in control_vars if col not in self.instr_vars]
+        self.group_var = group_var
+        self.cluster_var = cluster_var
+
+        columns = [outcome_var, treatment_var] + self.instr_vars
+        A = np.column_stack([data[col].to_numpy(dtype=float) for col in columns] + [np.ones(len(data))] +
+                            [data[col].to_numpy(dtype=float) for col in self.control_vars])
+        self.index = {col: i for i, col in enumerate(columns)}
+        self.constant = len(columns)
+        self.index.update({col: self.constant + 1 + i for i, col in enumerate(self.control_vars)})
+
+        clusters = data[cluster_var].to_numpy() if cluster_var is not None else None
+        self.cross_products = CrossProducts(A, data[group_var].to_numpy(), clusters)
+        self.digests = column_digests(data, columns + self.control_vars + [group_var] +
+                                      ([cluster_var] if cluster_var is not None else []))
+
+    @property
+    def groups(self):
+        return self.cross_products.groups
+
+    def fit(self, instr_vars, control_vars, cov_type='homoskedastic'):
+        instr_vars = [instr_vars] if isinstance(instr_vars, str) else list(instr_vars)
+        exogenous = [self.constant] + [self.index[col] for col in control_vars]
+        names = [self.treatment_var, 'const'] + list(control_vars)
+        return self.cross_products.fit_2sls(self.index[self.outcome_var], [self.index[self.treatment_var]],
+                                            [self.index[col] for col in instr_vars], exogenous, cov_type, names)
+
+    def spec_keys(self, instr_var, control_vars, cov_type='homoskedastic'):
+        """
+        Cache keys of the per-stage results of one specification, in the order of `groups`.
+        """
+        return [spec_key(self.digests, self.outcome_var, instr_var, self.treatment_var, control_vars,
+                         self.group_var, stage, f'2sls/{cov_type}',
+                         self.cluster_var if cov_type == 'cluster' else None)
+                for stage in self.groups]
+
+    def stage_columns(self, instr_var, control_vars, cov_type='homoskedastic'):
+        """
+        Per-stage results of one specification as a dict of arrays keyed by RESULT_COLUMNS.
+        """
+        grouped = self.fit(instr_var, control_vars, cov_type)
+        first_stage = grouped.first_stage[self.treatment_var]
+        t_values = grouped.params[:, 0] / grouped.bse[:, 0]
+        return {
+            'stage': grouped.groups,
+            '2sls_iv': grouped.params[:, 0],
+            'std_error': grouped.bse[:, 0],
+            'p_value': 2 * special.stdtr(grouped.df_inference, -np.abs(t_values)),
+            'r_squared': grouped.rsquared,
+            'f_stat': first_stage['f_stat'],
+            'f_p_value': first_stage['f_p_value'],
+        }
+
+    def stage_results(self, instr_var, control_vars, cov_type='homoskedastic'):
+        """
+        Per-stage results of one specification, in the format of `analyze_2sls_by_stage`.
+        """
+        columns = self.stage_columns(instr_var, control_vars, cov_type)
+        return [{col: values[i] for col, values in columns.items()} for i in range(len(columns['stage']))]
+
+    def fit_chunk(self, specs, cov_type='homoskedastic'):
+        """
+        Fit a chunk of (grid_id, instrument, controls) specifications into one columnar
+        table: a dict of arrays with a 'grid_id' column and RESULT_COLUMNS.
+        """
+        tables = [dict(self.stage_columns(instr_var, control_vars, cov_type),
+                       grid_id=np.full(len(self.groups), grid_id))
+                  for grid_id, instr_var, control_vars in specs]
+        return {col: np.concatenate([table[col] for table in tables]) for col in ['grid_id'] + RESULT_COLUMNS}
+
+    def run(self, specs, cov_type='homoskedastic'):
+        """
+        Fit every (grid_id, instrument, controls) specification.
+
+        Returns:
+        - list: Per specification and stage a result dict with 'grid_id', 'instrument'
+          and 'control_vars' added.
+        """
+        results = []
+        for grid_id, instr_var, control_vars in specs:
+            for stage_result in self.stage_results(instr_var, control_vars, cov_type):
+                stage_result.update({'grid_id': grid_id, 'instrument': instr_var, 'control_vars': control_vars})
+                results.append(stage_result)
+        return results
+
+
+_worker_search = None
+_worker_blocks = None
+
+
+def _attach_search(search, groups, spec):
+    global _worker_search, _worker_blocks
+    arrays, _worker_blocks = attach_arrays(spec)
+    search.cross_products = CrossProducts.from_arrays(groups, arrays)
+    _worker_search = search
+
+
+def _fit_chunk(specs, cov_type):
+    return _worker_search.fit_chunk(specs, cov_type)
+
+
+def _cache_entries(table, keys):
+    entries = []
+    for i, (grid_id, stage) in enumerate(zip(table['grid_id'], table['stage'])):
+        entry = {'key': keys[grid_id][stage]}
+        entry.update((field, float(table[field][i])) for field in CACHED_FIELDS)
+        entries.append(entry)
+    return entries
+
+
+def run_specifications(search, specs, cov_type='homoskedastic', jobs=1, chunksize=None, progress=True,
+                       cache=None):
+    """
+    Fit specifications with a SpecSearch, sharded in chunks over `jobs` worker processes.
+    The cross-products are placed in shared memory once and mapped by every worker; only
+    the specifications and the columnar chunk results cross process boundaries. Chunks
+    default to about eight per worker, so faster workers pick up the remaining ones.
+
+    With a SpecCache, specifications whose stages are all cached are skipped, each finished
+    chunk is appended to the cache, and the returned results are read back from it, so an
+    interrupted or extended search only fits the specifications it has not seen before.
+
+    Returns:
+    - pd.DataFrame: One row per specification and stage, ordered by grid_id and stage,
+      with 'grid_id', 'instrument', 'control_vars' and RESULT_COLUMNS.
+    """
+    keys = None
+    pending = specs
+    if cache is not None:
+        keys = {grid_id: dict(zip(search.groups, search.spec_keys(instr_var, control_vars, cov_type)))
+                for grid_id, instr_var, control_vars in specs}
+        pending = [spec for spec in specs if not all(key in cache for key in keys[spec[0]].values())]
+
+    chunksize = chunksize or max(1, math.ceil(len(pending) / (jobs * 8)))
+    chunks = [pending[i:i + chunksize] for i in range(0, len(pending), chunksize)]
+
+    tables = []
+
+    def collect(table):
+        if cache is not None:
+            cache.store(_cache_entries(table, keys))
+        tables.append(table)
+
+    with ProgressBar(len(pending), 'Specifications', enabled=progress) as progress_bar:
+        if jobs == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                collect(search.fit_chunk(chunk, cov_type))
+                progress_bar.update(len(chunk))
+        else:
+            # Workers get the search without its arrays and map these from shared memory
+            shell = copy.copy(search)
+            shell.cross_products = None
+            with SharedArrays(search.cross_products.arrays()) as shared, \
+                    ProcessPoolExecutor(max_workers=jobs, initializer=_attach_search,
+                                        initargs=(shell, search.groups, shared.spec)) as executor:
+                futures = {executor.submit(_fit_chunk, chunk, cov_type): len(chunk) for chunk in chunks}
+                for future in as_completed(futures):
+                    collect(future.result())
+                    progress_bar.update(futures[future])
+
+    columns = ['grid_id'] + RESULT_COLUMNS
+    if cache is not None:
+        # Every specification is now cached; build the table from the cache in spec order
+        rows = [dict(cache.get(key), grid_id=grid_id, stage=stage)
+                for grid_id, _, _ in specs for stage, key in keys[grid_id].items()]
+        tables = [{col: np.array([row[col] for row in rows]) for col in columns}] if rows else []
+    if not tables:
+        return pd.DataFrame(columns=['grid_id', 'instrument', 'control_vars'] + RESULT_COLUMNS)
+    results_df = pd.DataFrame({col: np.concatenate([table[col] for table in tables]) for col in columns})
+    results_df = results_df.sort_values(['grid_id', 'stage'], kind='stable').reset_index(drop=True)
+
+    spec_df = pd.DataFrame(specs, columns=['grid_id', 'instrument', 'control_vars'])
+    return spec_df.merge(results_df, on='grid_id')
@@ -1,34 +1,29 @@
-import time
-from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
-import ssl
-import certifi
 import warnings
 
+from data.distance.geocoder import get_geocoder
 
-def get_city_coordinates(team_name, city_name, country_name='Germany'):
-    geolocator = Nominatim(user_agent="UniqueAppNameOrPurpose",
-                           ssl_context=ssl.create_default_context(cafile=certifi.where()))
 
-    # Try to geocode using the full team name and city name
-    location = geolocator.geocode(f"{team_name} {city_name} {country_name}")
+def get_city_coordinates(team_name, city_name, country_name='Germany', geocoder=None):
+    if geocoder is None:
+        geocoder = get_geocoder(country_name)
 
-    # If no location is found, try using only the city name and country name
-    if not location:
-        location = geolocator.geocode(f"{city_name} {country_name}")
+    coordinates = geocoder.geocode(team_name, city_name, country_name)
 
     # If a location is found, return the coordinates
-    if location:
-        return (location.latitude, location.longitude)
+    if coordinates:
+        return coordinates
     else:
         warnings.warn(f"Coordinate for {city_name}, {country_name} not found!")
         return None
 
 
-def calculate_distance(team1, team2, city1, city2, country_name='Germany'):
-    coordinates1 = get_city_coordinates(team1, city1, country_name)
-    time.sleep(2)  # Pause for 2 seconds between geocoding requests
-    coordinates2 = get_city_coordinates(team2, city2, country_name)
+def calculate_distance(team1, team2, city1, city2, country_name='Germany', geocoder=None):
+    if geocoder is None:
+        geocoder = get_geocoder(country_name)
+
+    coordinates1 = get_city_coordinates(team1, city1, country_name, geocoder)
+    coordinates2 = get_city_coordinates(team2, city2, country_name, geocoder)
 
     if coordinates1 and coordinates2:
         distance = geodesic(coordinates1, coordinates2).kilometers
@@ -41,6 +36,3 @@ def calculate_distance(team1, team2, city1, city2, country_name='Germany'):
         if not coordinates2:
             warnings.warn(f"Coordinate for {city2}, {country_name} not found!")
         return None
-
-
-
@@ -0,0 +1,246 @@
+import os
+import re
+import ssl
+import threading
+import time
+import unicodedata
+
+import pandas as pd
+import Levenshtein
+
+from utils.load import project_root
+
+
+def normalize_place_name(name):
+    """
+    Normalize a place name for index lookups: lowercase, strip diacritics
+    and collapse punctuation to single spaces ('Mönchengladbach' -> 'monchengladbach').
+    """
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+
+
+class Geocoder:
+    """
+    Base class for geocoding backends. Subclasses implement `geocode`, which
+    returns a (latitude, longitude) tuple or None when the place is unknown.
+    """
+    name = 'base'
+
+    def geocode(self, team_name, city_name, country_name):
+        raise NotImplementedError
+
+
+class GazetteerGeocoder(Geocoder):
+    """
+    Offline geocoder backed by the gazetteer in settings/<country>/gazetteer.csv.
+
+    The gazetteer has columns ['name', 'latitude', 'longitude', 'aliases'], where
+    `aliases` is a '|'-separated list of alternative spellings, e.g. the district
+    names used in the team mappings. City coordinates were seeded from GeoNames
+    (CC BY 4.0).
+    """
+    name = 'gazetteer'
+
+    def __init__(self, country, fuzzy_cutoff=0.85, gazetteer_path=None):
+        if gazetteer_path is None:
+            gazetteer_path = os.path.join(project_root(), 'settings', country, 'gazetteer.csv')
+        self.country = country
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.cities = self._build_index(load_gazetteer(gazetteer_path))
+
+        # Block fuzzy candidates on the first character to avoid scanning the whole index
+        self.city_blocks = {}
+        for key in self.cities:
+            self.city_blocks.setdefault(key[:1], []).append(key)
+
+    @staticmethod
+    def _build_index(gazetteer):
+        cities = {}
+        for row in gazetteer.itertuples(index=False):
+            coordinates = (float(row.latitude), float(row.longitude))
+            names = [row.name] + [alias for alias in str(row.aliases).split('|') if alias]
+            for name in names:
+                cities.setdefault(normalize_place_name(name), coordinates)
+        return cities
+
+    def _closest(self, key, candidates):
+        best_key, best_score = None, 0
+        for candidate in candidates:
+            score = Levenshtein.ratio(key, candidate)
+            if score > best_score:
+                best_key, best_score = candidate, score
+        return best_key, best_score
+
+    def lookup_city(self, city_name):
+        key = normalize_place_name(city_name)
+        if key in self.cities:
+            return self.cities[key]
+
+        # Drop qualifiers such as 'Funchal, Madeira' before falling back to fuzzy matching
+        base_key = normalize_place_name(str(city_name).split(',')[0])
+        if base_key in self.cities:
+            return self.cities[base_key]
+
+        best_key, best_score = self._closest(key, self.city_blocks.get(key[:1], []))
+        if best_score < self.fuzzy_cutoff:
+            # A typo in the first character misses the block; scan the whole index
+            best_key, best_score = self._closest(key, self.cities)
+
+        if best_score >= self.fuzzy_cutoff:
+            return self.cities[best_key]
+        return None
+
+    def geocode(self, team_name, city_name, country_name):
+        return self.lookup_city(city_name)
+
+
+class GeopyGeocoder(Geocoder):
+    """
+    Base class for online geocoders from geopy. Requests are spaced by `min_delay`
+    seconds; pass min_delay=0 when requests are rate limited by a GeocoderPool.
+    """
+    name = 'geopy'
+
+    def __init__(self, geolocator, min_delay=2):
+        self.geolocator = geolocator
+        self.min_delay = min_delay
+        self.last_request = 0.0
+        self.lock = threading.Lock()
+
+    def _geocode_query(self, query):
+        with self.lock:
+            wait = self.min_delay - (time.monotonic() - self.last_request)
+            if wait > 0:
+                time.sleep(wait)
+            self.last_request = time.monotonic()
+        return self.geolocator.geocode(query)
+
+    def geocode(self, team_name, city_name, country_name):
+        # Try to geocode using the full team name and city name
+        location = self._geocode_query(f"{team_name} {city_name} {country_name}")
+
+        # If no location is found, try using only the city name and country name
+        if not location:
+            location = self._geocode_query(f"{city_name} {country_name}")
+
+        if location:
+            return (location.latitude, location.longitude)
+        return None
+
+
+class NominatimGeocoder(GeopyGeocoder):
+    """
+    Online geocoder using OpenStreetMap Nominatim.
+    """
+    name = 'nominatim'
+
+    def __init__(self, user_agent=None, min_delay=2):
+        from geopy.geocoders import Nominatim
+        import certifi
+
+        if user_agent is None:
+            user_agent = os.environ.get('GEOCODER_USER_AGENT', 'sequential-causal-inference')
+        super().__init__(Nominatim(user_agent=user_agent,
+                                   ssl_context=ssl.create_default_context(cafile=certifi.where())), min_delay)
+
+
+class PhotonGeocoder(GeopyGeocoder):
+    """
+    Online geocoder using the Komoot Photon API (OpenStreetMap data, no API key).
+    """
+    name = 'photon'
+
+    def __init__(self, user_agent=None, min_delay=2):
+        from geopy.geocoders import Photon
+        import certifi
+
+        if user_agent is None:
+            user_agent = os.environ.get('GEOCODER_USER_AGENT', 'sequential-causal-inference')
+        super().__init__(Photon(user_agent=user_agent,
+                                ssl_context=ssl.create_default_context(cafile=certifi.where())), min_delay)
+
+
+class StandInGeocoder(Geocoder):
+    """
+    Local stand-in for an online geocoder: answers from the offline gazetteer after
+    a simulated request latency. Used to exercise and benchmark concurrent geocoding
+    without network access.
+    """
+    name = 'standin'
+
+    def __init__(self, country, latency=0.2):
+        self.gazetteer = GazetteerGeocoder(country)
+        self.latency = latency
+
+    def geocode(self, team_name, city_name, country_name):
+        time.sleep(self.latency)
+        return self.gazetteer.geocode(team_name, city_name, country_name)
+
+
+class ChainGeocoder(Geocoder):
+    """
+    Try a sequence of geocoders in order and return the first hit.
+    """
+    name = 'chain'
+
+    def __init__(self, geocoders):
+        self.geocoders = list(geocoders)
+
+    def geocode(self, team_name, city_name, country_name):
+        for geocoder in self.geocoders:
+            coordinates = geocoder.geocode(team_name, city_name, country_name)
+            if coordinates:
+                return coordinates
+        return None
+
+
+class CachedGeocoder(Geocoder):
+    """
+    Memoize another geocoder per (team_name, city_name). The cache can be seeded,
+    e.g. with coordinates resolved concurrently by a GeocoderPool.
+    """
+    name = 'cached'
+
+    def __init__(self, geocoder, cache=None):
+        self.geocoder = geocoder
+        self.cache = {} if cache is None else cache
+
+    def geocode(self, team_name, city_name, country_name):
+        key = (team_name, city_name)
+        if key not in self.cache:
+            self.cache[key] = self.geocoder.geocode(team_name, city_name, country_name)
+        return self.cache[key]
+
+
+def load_gazetteer(gazetteer_path):
+    if os.path.exists(gazetteer_path):
+        return pd.read_csv(gazetteer_path, keep_default_na=False)
+    else:
+        raise FileNotFoundError(f"Gazetteer file not found: {gazetteer_path}")
+
+
+def create_geocoder(country, backend, **options):
+    if backend == 'gazetteer':
+        return GazetteerGeocoder(country, **options)
+    elif backend == 'standin':
+        return StandInGeocoder(country, **options)
+    elif backend == 'nominatim':
+        return NominatimGeocoder(**options)
+    elif backend == 'photon':
+        return PhotonGeocoder(**options)
+    else:
+        raise ValueError(f"Unknown geocoder backend: {backend}")
+
+
+def get_geocoder(country, backends=('gazetteer',)):
+    """
+    Build a geocoder for a country from backend names. The default is the offline
+    gazetteer only; pass backends=('gazetteer', 'nominatim') to fall back to Nominatim
+    for places missing from the gazetteer.
+    """
+    geocoders = [create_geocoder(country, backend) for backend in backends]
+
+    if len(geocoders) == 1:
+        return geocoders[0]
+    return ChainGeocoder(geocoders)
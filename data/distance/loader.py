@@ -3,6 +3,8 @@ import pandas as pd
 import time
 from utils.load import project_root
 from data.distance.core import calculate_distance
+from data.distance.geocoder import CachedGeocoder, get_geocoder
+from data.distance.pool import GeocoderPool
 
 
 def load_team_city_mapping(country, cup):
@@ -14,10 +16,7 @@ def load_team_city_mapping(country, cup):
         raise FileNotFoundError(f"Team mapping file not found for {country} - {cup}")
 
 
-def calculate_distances(fixtures, country, cup):
-    # Load the team-city mapping
-    team_city_mapping = load_team_city_mapping(country, cup)
-
+def unique_team_pairs(fixtures, team_city_mapping):
     unique_combinations = (fixtures[['team_name', 'opponent_name']]
                            .drop_duplicates()
                            .assign(
@@ -39,50 +38,249 @@ def calculate_distances(fixtures, country, cup):
         on='opponent_name', how='left'
     )
 
-    # Calculate distances
-    unique_combinations['distance'] = None
-    for i, row in unique_combinations.iterrows():
-        print(f'Processing row {i + 1}/{len(unique_combinations)}')
+    return unique_combinations
+
+
+def calculate_distance_with_retry(row, country, geocoder, max_retries=3, backoff=2):
+    """
+    Calculate the distance for a team pair, retrying failed requests with exponential
+    backoff. Raises the last error when all retries fail.
+    """
+    for attempt in range(max_retries + 1):
         try:
-            distance = calculate_distance(row['team_name'], row['opponent_name'], row['team_city'],
-                                          row['opponent_city'], country)
-            unique_combinations.at[i, 'distance'] = distance
+            return calculate_distance(row['team_name'], row['opponent_name'], row['team_city'],
+                                      row['opponent_city'], country, geocoder)
         except Exception as e:
-            print(f"Error calculating distance for index {i}: {e}")
-            save_intermediate_csv(unique_combinations, country, i)
-            time.sleep(60)  # Wait a minute before retrying
+            if attempt == max_retries:
+                raise
+            wait = backoff * 2 ** attempt
+            print(f"Error calculating distance for {row['team_name']} - {row['opponent_name']}: {e}. "
+                  f"Retrying in {wait} seconds...")
+            time.sleep(wait)
 
-    return unique_combinations
 
+def calculate_distances(fixtures, country, cup, geocoder=None, batch_size=25, max_retries=3, backoff=2):
+    """
+    Calculate distances for all unique team pairs in the fixtures as a checkpointed job.
 
-def save_intermediate_csv(df, country, row_index):
-    project_root_path = project_root()
-    save_path = os.path.join(project_root_path, 'data', 'process', country, f'{cup}_distance_data_incomplete.csv')
+    Completed pairs are persisted to `{cup}_distance_data_incomplete.csv` after every
+    batch of `batch_size` pairs, and pairs already in that checkpoint are skipped, so an
+    interrupted run resumes where it stopped and loses at most the in-flight batch.
+    Pairs that still fail after `max_retries` retries, or whose cities cannot be
+    geocoded, are left out of the checkpoint and retried on the next run.
+
+    Returns:
+    - pd.DataFrame: Completed team pairs with cities and distances, in pair order.
+    - int: Number of pairs that failed in this run.
+    """
+    # Load the team-city mapping
+    team_city_mapping = load_team_city_mapping(country, cup)
+
+    if geocoder is None:
+        geocoder = get_geocoder(country)
+
+    unique_combinations = unique_team_pairs(fixtures, team_city_mapping)
+
+    checkpoint = load_checkpoint(country, cup)
+    completed = set(zip(checkpoint['team_name'], checkpoint['opponent_name']))
+    pending = unique_combinations[[pair not in completed for pair in
+                                   zip(unique_combinations['team_name'], unique_combinations['opponent_name'])]]
+    print(f"Resuming from checkpoint with {len(completed)} completed pairs, {len(pending)} pairs to process")
+
+    # Resolve the coordinates of all pending teams up front, concurrently when a pool is given
+    coordinates = load_coordinates(country, cup)
+    if isinstance(geocoder, GeocoderPool):
+        queries = list(zip(pending['team_name'], pending['team_city'])) + \
+                  list(zip(pending['opponent_name'], pending['opponent_city']))
+        prefetch_coordinates(queries, coordinates, geocoder, country)
+        save_coordinates(coordinates, country, cup)
+    geocoder = CachedGeocoder(geocoder, coordinates)
+
+    failed = 0
+    for batch_start in range(0, len(pending), batch_size):
+        batch = pending.iloc[batch_start:batch_start + batch_size].copy()
+        batch['distance'] = None
+        print(f'Processing pairs {batch_start + 1}-{batch_start + len(batch)}/{len(pending)}')
+
+        succeeded = []
+        for i, row in batch.iterrows():
+            try:
+                distance = calculate_distance_with_retry(row, country, geocoder, max_retries, backoff)
+            except Exception as e:
+                print(f"Giving up on {row['team_name']} - {row['opponent_name']} for this run: {e}")
+                failed += 1
+                continue
+
+            # An unresolved city is a failure too, so the pair is retried once the geocoder knows it
+            if distance is None:
+                print(f"No coordinates for {row['team_name']} - {row['opponent_name']}, skipping for this run")
+                failed += 1
+                continue
+            batch.at[i, 'distance'] = distance
+            succeeded.append(i)
+
+        checkpoint = pd.concat([checkpoint, batch.loc[succeeded]], ignore_index=True)
+        save_checkpoint(checkpoint, country, cup)
+
+    if failed:
+        print(f"{failed} pairs failed and will be retried on the next run")
+    save_coordinates(coordinates, country, cup)
+
+    distances = unique_combinations.merge(checkpoint[['team_name', 'opponent_name', 'distance']],
+                                          on=['team_name', 'opponent_name'], how='inner')
+    return distances, failed
+
+
+def prefetch_coordinates(queries, coordinates, pool, country):
+    queries = [query for query in dict.fromkeys(queries) if query not in coordinates]
+    print(f"Geocoding {len(queries)} teams with {len(pool.backends)} backends")
+    coordinates.update(pool.geocode_many(queries, country))
+
+
+def resolve_team_coordinates(country, cup, pool=None):
+    """
+    Resolve coordinates for every team in the team-city mapping, geocoding only the
+    teams missing from the coordinates cache.
+
+    Returns:
+    - pd.DataFrame: Team coordinates with columns ['team_name', 'city', 'latitude', 'longitude'].
+    """
+    if pool is None:
+        pool = GeocoderPool.from_config(country, ('gazetteer',))
+
+    team_city_mapping = load_team_city_mapping(country, cup).dropna(subset=['city'])
+    coordinates = load_coordinates(country, cup)
+    prefetch_coordinates(list(zip(team_city_mapping['cup_name'], team_city_mapping['city'])), coordinates, pool,
+                         country)
+    save_coordinates(coordinates, country, cup)
+    return pd.read_csv(coordinates_path(country, cup))
+
+
+def coordinates_path(country, cup):
+    return os.path.join(project_root(), 'data', 'process', country, f'{cup}_coordinates.csv')
+
+
+def load_coordinates(country, cup):
+    """
+    Load the cache of resolved team coordinates as a dict keyed by (team_name, city).
+    """
+    path = coordinates_path(country, cup)
+    if not os.path.exists(path):
+        return {}
+    cache = pd.read_csv(path)
+    return {(row.team_name, row.city): (row.latitude, row.longitude) for row in cache.itertuples(index=False)}
+
+
+def save_coordinates(coordinates, country, cup):
+    rows = [{'team_name': team_name, 'city': city, 'latitude': location[0], 'longitude': location[1]}
+            for (team_name, city), location in coordinates.items() if location]
+    cache = pd.DataFrame(rows, columns=['team_name', 'city', 'latitude', 'longitude'])
+
+    save_path = coordinates_path(country, cup)
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    df.to_csv(save_path, index=False)
-    print(f"Saved incomplete data at row {row_index} to {save_path}")
+    cache.sort_values(by=['team_name', 'city']).to_csv(save_path, index=False)
+
+
+def checkpoint_path(country, cup):
+    return os.path.join(project_root(), 'data', 'process', country, f'{cup}_distance_data_incomplete.csv')
+
+
+def load_checkpoint(country, cup):
+    path = checkpoint_path(country, cup)
+    if os.path.exists(path):
+        # Checkpoints written before unresolved pairs counted as failures may hold empty distances
+        return pd.read_csv(path).dropna(subset=['distance']).reset_index(drop=True)
+    return pd.DataFrame(columns=['team_name', 'opponent_name', 'team_city', 'opponent_city', 'distance'])
+
+
+def save_checkpoint(df, country, cup):
+    save_path = checkpoint_path(country, cup)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+    # Write to a temporary file first so an interrupted write never corrupts the checkpoint
+    tmp_path = save_path + '.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, save_path)
+    print(f"Saved checkpoint with {len(df)} pairs to {save_path}")
+
+
+def distance_data_path(country, cup):
+    return os.path.join(project_root(), 'data', 'process', country, f'{cup}_distance_data.csv')
+
+
+def load_distance_data(country, cup):
+    path = distance_data_path(country, cup)
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    return pd.DataFrame(columns=['team_name', 'opponent_name', 'team_city', 'opponent_city', 'distance'])
 
 
 def save_to_csv(df, country, cup):
-    project_root_path = project_root()
-    save_path = os.path.join(project_root_path, 'data', 'process', country, f'{cup}_distance_data.csv')
+    save_path = distance_data_path(country, cup)
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     df.to_csv(save_path, index=False)
-    print(f"Saved complete data to {save_path}")
+    print(f"Saved distance data to {save_path}")
+
+
+def pair_keys(df, columns=('team_name', 'opponent_name')):
+    """
+    Order-independent (team, opponent) keys, so a pair and its reverse share one key.
+    """
+    team, opponent = df[columns[0]], df[columns[1]]
+    first = team.where(team <= opponent, opponent)
+    second = opponent.where(team <= opponent, team)
+    return list(zip(first, second))
+
+
+def resolve_distances(cup_fixtures, country, cup, geocoder=None):
+    """
+    Lazily resolve the distance data needed by cup fixtures. Only away rows carry a
+    travel distance, so only their team pairs are considered, and only pairs missing
+    from `{cup}_distance_data.csv` are computed and appended to it. The work for an
+    incremental season is therefore proportional to its new away fixtures.
+
+    Returns:
+    - pd.DataFrame: Distance data covering the away fixtures that could be resolved.
+    """
+    distance_data = load_distance_data(country, cup)
+    known_pairs = set(pair_keys(distance_data))
+
+    away_matches = cup_fixtures.loc[cup_fixtures['team_home'] == 'away', ['team_name', 'opponent_name']]
+    missing = away_matches[[key not in known_pairs for key in pair_keys(away_matches)]]
+    if missing.empty:
+        return distance_data
+
+    print(f"Resolving distances for {len(missing.drop_duplicates())} new away fixtures")
+    new_distances, failed = calculate_distances(missing, country, cup, geocoder)
+
+    # Publish the completed pairs; failed pairs stay missing and are retried on the next run
+    distance_data = (pd.concat([distance_data, new_distances], ignore_index=True)
+                     .sort_values(by=['team_name', 'opponent_name'])
+                     .reset_index(drop=True))
+    save_to_csv(distance_data, country, cup)
+    if os.path.exists(checkpoint_path(country, cup)):
+        os.remove(checkpoint_path(country, cup))
+    if failed:
+        print(f"Distance data for {cup} is missing {failed} pairs, rerun to retry them")
+
+    return distance_data
 
 
-def process_cup_fixtures(country, cup):
+def process_cup_fixtures(country, cup, geocoder=None):
     project_root_path = project_root()
     fixtures_path = os.path.join(project_root_path, 'data', 'process', country, f'{cup}_fixtures.csv')
 
     fixtures_data = pd.read_csv(fixtures_path)
-    fixtures_with_distances = calculate_distances(fixtures_data, country, cup)
-    save_to_csv(fixtures_with_distances, country, cup)
-    return fixtures_with_distances
+    return resolve_distances(fixtures_data, country, cup, geocoder)
 
 
-def request_distance_data(country, cup):
-    fixtures_df = process_cup_fixtures(country, cup)
+def request_distance_data(country, cup, backends=('gazetteer',)):
+    """
+    Resolve the distance data for a cup's away fixtures. `backends` lists geocoder backend names, or
+    dicts with a rate policy such as {'name': 'nominatim', 'rate': 1.0, 'workers': 1},
+    which are queried concurrently through a GeocoderPool.
+    """
+    fixtures_df = process_cup_fixtures(country, cup, GeocoderPool.from_config(country, backends))
     print(fixtures_df.head())
 
 
@@ -0,0 +1,143 @@
+import threading
+import warnings
+
+from data.distance.geocoder import Geocoder, create_geocoder
+from utils.ratelimit import RateLimiter
+
+# Default rate policies in requests per second; None means unlimited
+DEFAULT_RATES = {
+    'gazetteer': None,
+    'standin': 5.0,
+    'nominatim': 1.0,
+    'photon': 1.0,
+}
+
+
+class GeocoderBackend:
+    """
+    A geocoder together with its rate policy, number of worker threads and priority.
+    Backends with a lower priority are tried first; backends sharing a priority
+    split the lookups between them.
+    """
+
+    def __init__(self, geocoder, rate=None, burst=1, workers=1, priority=0):
+        self.geocoder = geocoder
+        self.name = geocoder.name
+        self.limiter = RateLimiter(rate, burst)
+        self.workers = workers
+        self.priority = priority
+
+
+class GeocoderPool(Geocoder):
+    """
+    Worker pool that resolves coordinates concurrently against several rate-limited
+    geocoder backends.
+
+    Every backend runs its own worker threads, which pull lookups from a shared queue
+    and wait only on their backend's rate limiter. A lookup that a backend cannot
+    resolve is handed on to the backends that have not tried it yet, in priority order.
+    With a cold cache, throughput is therefore bounded by the sum of the backends'
+    allowed rates.
+    """
+    name = 'pool'
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    @classmethod
+    def from_config(cls, country, backends):
+        """
+        Build a pool from backend names or dicts such as
+        {'name': 'nominatim', 'rate': 1.0, 'workers': 1, 'priority': 1}.
+        Unless given, priorities follow the order of `backends`.
+        """
+        pool_backends = []
+        for position, backend in enumerate(backends):
+            config = {'name': backend} if isinstance(backend, str) else dict(backend)
+            name = config.pop('name')
+            rate = config.pop('rate', DEFAULT_RATES.get(name))
+            burst = config.pop('burst', 1)
+            workers = config.pop('workers', 1)
+            priority = config.pop('priority', position)
+
+            # Online geocoders are spaced by the pool's rate limiter instead of their own delay
+            if name in ('nominatim', 'photon'):
+                config.setdefault('min_delay', 0)
+
+            pool_backends.append(GeocoderBackend(create_geocoder(country, name, **config),
+                                                 rate, burst, workers, priority))
+        return cls(pool_backends)
+
+    def _eligible(self, backend, tried):
+        if backend in tried:
+            return False
+        # Only take lookups that every higher-priority backend has already tried
+        return all(other in tried for other in self.backends if other.priority < backend.priority)
+
+    def geocode_many(self, queries, country_name):
+        """
+        Resolve (team_name, city_name) queries concurrently.
+
+        Returns:
+        - dict: Mapping from (team_name, city_name) to (latitude, longitude), or None when
+          no backend knows the place. Lookups where a backend raised an error and none
+          succeeded are left out, so they can be retried.
+        """
+        pending = [{'query': query, 'tried': set(), 'failed': False} for query in dict.fromkeys(queries)]
+        results = {}
+        state = {'in_flight': 0}
+        condition = threading.Condition()
+
+        def next_task(backend):
+            with condition:
+                while True:
+                    for task in pending:
+                        if self._eligible(backend, task['tried']):
+                            pending.remove(task)
+                            state['in_flight'] += 1
+                            return task
+                    # Nothing left for this backend unless an in-flight lookup comes back unresolved
+                    if state['in_flight'] == 0:
+                        return None
+                    condition.wait()
+
+        def worker(backend):
+            while True:
+                task = next_task(backend)
+                if task is None:
+                    return
+
+                team_name, city_name = task['query']
+                backend.limiter.acquire()
+                try:
+                    coordinates = backend.geocoder.geocode(team_name, city_name, country_name)
+                except Exception as e:
+                    warnings.warn(f"{backend.name} failed for {team_name}, {city_name}: {e}")
+                    coordinates = None
+                    task['failed'] = True
+
+                with condition:
+                    state['in_flight'] -= 1
+                    task['tried'].add(backend)
+                    if coordinates:
+                        results[task['query']] = coordinates
+                    elif len(task['tried']) < len(self.backends):
+                        pending.append(task)
+                    elif not task['failed']:
+                        results[task['query']] = None
+                    condition.notify_all()
+
+        threads = [threading.Thread(target=worker, args=(backend,), daemon=True)
+                   for backend in self.backends for _ in range(backend.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def geocode(self, team_name, city_name, country_name):
+        results = self.geocode_many([(team_name, city_name)], country_name)
+        if (team_name, city_name) not in results:
+            raise RuntimeError(f"All geocoder backends failed for {team_name}, {city_name}")
+        return results[(team_name, city_name)]
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_radians(coordinates):
+    return np.radians(coordinates[['latitude', 'longitude']].to_numpy(dtype=float))
+
+
+def build_spatial_index(coordinates):
+    """
+    Build a BallTree on haversine distances over a dataframe with 'latitude' and 'longitude' columns.
+    """
+    return BallTree(to_radians(coordinates), metric='haversine')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+
+
+def assign_regions(coordinates, n_regions=6, random_state=0):
+    """
+    Cluster team locations into regions with k-means on unit-sphere coordinates.
+
+    Returns:
+    - pd.Series: Region label per team name.
+    """
+    radians = to_radians(coordinates)
+    unit_vectors = np.column_stack([np.cos(radians[:, 0]) * np.cos(radians[:, 1]),
+                                    np.cos(radians[:, 0]) * np.sin(radians[:, 1]),
+                                    np.sin(radians[:, 0])])
+    n_regions = min(n_regions, len(coordinates))
+    labels = KMeans(n_clusters=n_regions, n_init=10, random_state=random_state).fit_predict(unit_vectors)
+    return pd.Series(labels, index=coordinates.index, name='region')
+
+
+def add_spatial_features(cup_fixtures, coordinates, k=3, derby_radius=30, n_regions=6):
+    """
+    Add location controls to cup fixtures from cached team coordinates:
+
+    - `nearest_rival_distance`, `mean_rival_distance`: distance in km to the nearest and
+      the mean distance to the k nearest professional clubs of the same season.
+    - `rivals_within_radius`: number of professional clubs within `derby_radius` km.
+    - `local_derby`: 1 if the opponent is based within `derby_radius` km.
+    - `region`: regional cluster of the team's location.
+
+    Professional clubs are teams in a league division, i.e. below the non-league
+    division set by `set_non_league_rank`. Each season is queried against one BallTree
+    in a single batched call. Rows of teams without coordinates get NaN.
+
+    Returns:
+    - pd.DataFrame: Cup fixtures with the spatial features.
+    """
+    coordinates = (coordinates.dropna(subset=['latitude', 'longitude'])
+                   .drop_duplicates(subset=['team_name'])
+                   .set_index('team_name')[['latitude', 'longitude']])
+
+    team_lat = cup_fixtures['team_name'].map(coordinates['latitude'])
+    team_lon = cup_fixtures['team_name'].map(coordinates['longitude'])
+    opponent_lat = cup_fixtures['opponent_name'].map(coordinates['latitude'])
+    opponent_lon = cup_fixtures['opponent_name'].map(coordinates['longitude'])
+
+    opponent_distance = haversine_km(team_lat, team_lon, opponent_lat, opponent_lon)
+    cup_fixtures['local_derby'] = np.where(opponent_distance.isna(), np.nan,
+                                           (opponent_distance <= derby_radius).astype(float))
+    cup_fixtures['region'] = cup_fixtures['team_name'].map(assign_regions(coordinates, n_regions))
+
+    non_league_division = cup_fixtures['team_division'].max()
+    is_professional = (cup_fixtures['team_division'] < non_league_division).to_numpy()
+    has_coordinates = team_lat.notna().to_numpy()
+
+    cup_fixtures['nearest_rival_distance'] = np.nan
+    cup_fixtures['mean_rival_distance'] = np.nan
+    cup_fixtures['rivals_within_radius'] = np.nan
+
+    for year in cup_fixtures['year'].unique():
+        in_year = (cup_fixtures['year'] == year).to_numpy()
+        professional_teams = cup_fixtures.loc[in_year & is_professional & has_coordinates, 'team_name'].unique()
+        if len(professional_teams) <= k:
+            continue
+
+        tree = build_spatial_index(coordinates.loc[professional_teams])
+        rows = in_year & has_coordinates
+        query_points = np.radians(np.column_stack([team_lat[rows], team_lon[rows]]))
+
+        # Query one extra neighbour: a professional team always finds itself at distance 0
+        distances, _ = tree.query(query_points, k=k + 1)
+        distances = distances * EARTH_RADIUS_KM
+        own_club = is_professional[rows]
+        nearest = np.where(own_club[:, None], distances[:, 1:], distances[:, :k])
+
+        within_radius = tree.query_radius(query_points, r=derby_radius / EARTH_RADIUS_KM, count_only=True)
+
+        cup_fixtures.loc[rows, 'nearest_rival_distance'] = nearest[:, 0]
+        cup_fixtures.loc[rows, 'mean_rival_distance'] = nearest.mean(axis=1)
+        cup_fixtures.loc[rows, 'rivals_within_radius'] = within_radius - own_club
+
+    return cup_fixtures
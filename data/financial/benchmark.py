@@ -0,0 +1,49 @@
+import glob
+import json
+import os
+import time
+
+from data.financial.cache import PageCache
+from data.financial.scrape import parse_league_page, parse_league_page_soup
+
+
+def benchmark_parsers(cache=None, repeat=5):
+    """
+    Time parse_league_page against the BeautifulSoup reference parser on every cached
+    page and check that both produce the same financial data.
+
+    Returns:
+    - dict: Mean parse time per page in milliseconds for each parser.
+    """
+    cache = cache or PageCache()
+    entries = []
+    for path in sorted(glob.glob(os.path.join(cache.root, 'entries', '*.json'))):
+        with open(path, 'r') as file:
+            entries.append(json.load(file))
+    pages = [(cache.load(entry), entry['season']) for entry in entries]
+    if not pages:
+        raise ValueError(f"No cached pages found in {cache.root}")
+
+    timings = {}
+    for name, parser in [('lxml', parse_league_page), ('html.parser', parse_league_page_soup)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content, season in pages:
+                parser(content, 'benchmark', season)
+        timings[name] = (time.perf_counter() - start) / (repeat * len(pages)) * 1000
+
+    for content, season in pages:
+        if not parse_league_page(content, 'benchmark', season).equals(
+                parse_league_page_soup(content, 'benchmark', season)):
+            raise AssertionError(f"Parsers disagree for season {season}")
+
+    print(f"Parsed {len(pages)} cached pages {repeat} times")
+    for name, timing in timings.items():
+        print(f"{name}:\t{timing:.2f} ms per page")
+    print(f"Speedup:\t{timings['html.parser'] / timings['lxml']:.1f}x")
+
+    return timings
+
+
+if __name__ == "__main__":
+    benchmark_parsers()
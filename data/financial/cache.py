@@ -0,0 +1,122 @@
+import datetime
+import hashlib
+import json
+import os
+
+from utils.load import project_root
+
+
+def current_season(today=None):
+    """
+    Starting year of the season in progress; seasons start on July 1st.
+    """
+    today = today or datetime.date.today()
+    return today.year if today.month >= 7 else today.year - 1
+
+
+def season_end(season):
+    """
+    Moment a season closes: July 1st of the following year, UTC.
+    """
+    return datetime.datetime(season + 1, 7, 1, tzinfo=datetime.timezone.utc)
+
+
+class PageCache:
+    """
+    On-disk cache of scraped HTML pages.
+
+    Page bodies are stored content-addressed under `pages/<sha256>.html`, and every
+    (url, season) has a small JSON entry under `entries/` with the content hash and
+    the ETag/Last-Modified validators of the response. Pages of a closed season that
+    were fetched after it ended are final and never refetched; open seasons, and closed
+    seasons whose page was fetched while they were still running, are revalidated with
+    a conditional request.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(project_root(), 'data', 'financial', 'cache')
+        os.makedirs(os.path.join(self.root, 'pages'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'entries'), exist_ok=True)
+
+    @staticmethod
+    def key(url, season):
+        return hashlib.sha1(f'{season}|{url}'.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, url, season):
+        return os.path.join(self.root, 'entries', f'{self.key(url, season)}.json')
+
+    def _page_path(self, content_hash):
+        return os.path.join(self.root, 'pages', f'{content_hash}.html')
+
+    def lookup(self, url, season):
+        path = self._entry_path(url, season)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as file:
+            entry = json.load(file)
+        if not os.path.exists(self._page_path(entry['content_hash'])):
+            return None
+        return entry
+
+    def load(self, entry):
+        with open(self._page_path(entry['content_hash']), 'rb') as file:
+            return file.read()
+
+    def revalidated(self, entry):
+        """
+        Record that a cached page was confirmed unchanged by a 304 response.
+        """
+        entry = dict(entry, fetched_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+        self._write_atomic(self._entry_path(entry['url'], entry['season']),
+                           json.dumps(entry, indent=2).encode('utf-8'))
+        return entry
+
+    def store(self, url, season, response):
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        page_path = self._page_path(content_hash)
+        if not os.path.exists(page_path):
+            self._write_atomic(page_path, content)
+
+        entry = {
+            'url': url,
+            'season': season,
+            'content_hash': content_hash,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self._write_atomic(self._entry_path(url, season), json.dumps(entry, indent=2).encode('utf-8'))
+        return entry
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def is_closed(season, today=None):
+        return season < current_season(today)
+
+    @classmethod
+    def is_final(cls, entry, today=None):
+        """
+        Whether a cached page holds the final state of its season: the season is closed
+        and the page was fetched after it ended, not frozen at mid-season values.
+        """
+        if not cls.is_closed(entry['season'], today) or not entry.get('fetched_at'):
+            return False
+        return datetime.datetime.fromisoformat(entry['fetched_at']) >= season_end(entry['season'])
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
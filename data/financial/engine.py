@@ -0,0 +1,101 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from data.financial.scrape import HEADERS
+from utils.ratelimit import RateLimiter
+
+
+class ScrapeEngine:
+    """
+    Polite concurrent page fetcher for Transfermarkt.
+
+    All requests share one keep-alive `requests.Session`, at most `workers` requests
+    are in flight, and every host is limited to `rate` requests per second. Failed
+    pages are put on a retry queue with exponential backoff instead of blocking a
+    worker, and a 429 response pauses the whole host for its Retry-After period.
+    """
+
+    def __init__(self, workers=4, rate=1.0, retries=3, backoff=5, timeout=30):
+        self.workers = workers
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiters = {}
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def limiter(self, url):
+        host = urlparse(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = RateLimiter(self.rate)
+        return self.limiters[host]
+
+    def fetch(self, url, headers=None):
+        limiter = self.limiter(url)
+        limiter.acquire()
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After', '')
+            limiter.penalize(float(retry_after) if retry_after.isdigit() else self.backoff)
+        response.raise_for_status()
+        return response
+
+    def run(self, jobs, handle):
+        """
+        Fetch every job's URL concurrently and pass the response to `handle(job, response)`.
+        Jobs are dicts with at least a 'url' key and optional request 'headers'.
+
+        Returns:
+        - list: Results of `handle` for the successful jobs, in job order.
+        - list: Jobs that still failed after all retries.
+        """
+        results, failed = {}, []
+        queue = [(0.0, index, job, 0) for index, job in enumerate(jobs)]
+        heapq.heapify(queue)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while queue or running:
+                # Submit every job whose retry time has come, keeping at most `workers` in flight
+                now = time.monotonic()
+                while queue and queue[0][0] <= now and len(running) < self.workers:
+                    _, index, job, attempt = heapq.heappop(queue)
+                    running[executor.submit(self.fetch, job['url'], job.get('headers'))] = (index, job, attempt)
+
+                timeout = max(queue[0][0] - now, 0) if queue and len(running) < self.workers else None
+                if not running:
+                    time.sleep(timeout)
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, job, attempt = running.pop(future)
+                    try:
+                        response = future.result()
+                    except requests.exceptions.RequestException as e:
+                        if attempt + 1 < self.retries:
+                            delay = self.backoff * 2 ** attempt
+                            print(f"Request failed for {job['url']}: {e}. Queued for retry in {delay} seconds...")
+                            heapq.heappush(queue, (time.monotonic() + delay, index, job, attempt + 1))
+                        else:
+                            print(f"Failed to retrieve {job['url']} after {self.retries} attempts.")
+                            failed.append(job)
+                        continue
+
+                    try:
+                        results[index] = handle(job, response)
+                    except Exception as e:
+                        print(f"Failed to process {job['url']}: {e}")
+                        failed.append(job)
+
+        return [results[index] for index in sorted(results)], failed
@@ -1,39 +1,135 @@
 import os
 import pandas as pd
 
-from data.financial.scrape import scrape_league_data
+from data.financial.cache import PageCache
+from data.financial.engine import ScrapeEngine
+from data.financial.scrape import TRANSFERMARKT_URL, league_url, parse_league_page
 from utils.load import project_root, load_mappings_from_yaml
 
 
-def request_financial_data(country, cup):
+def financial_data_path(country, cup):
+    return os.path.join(project_root(), 'data', 'process', country, f'{cup}_financial_data.csv')
+
+
+def partition_path(country, league_name, season):
+    return os.path.join(project_root(), 'data', 'process', country, 'financial', league_name, f'{season}.csv')
+
+
+def save_partition(df, country, league_name, season):
+    save_path = partition_path(country, league_name, season)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    tmp_path = save_path + '.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, save_path)
+
+
+def league_seasons(country):
+    """
+    List the (league_name, season, transfermarkt_name) partitions of the country mapping.
+    """
     mappings = load_mappings_from_yaml(os.path.join(project_root(),
                                                     'settings',
                                                     f'mapping_{country.lower()}.yaml'))
+    partitions = []
+    for league_name, config in mappings.items():
+        if config['transfermarkt_name'] != 'none':
+            for season in range(config['season_start'], config['season_end'] + 1):
+                partitions.append((league_name, season, config['transfermarkt_name']))
+    return partitions
 
-    data_seasons = []
 
-    for league_name, config in mappings.items():
-        print(f'Requesting financial data for {league_name}')
-        start = config['season_start']
-        end = config['season_end']
-        transfermarkt_name = config['transfermarkt_name']
-
-        if transfermarkt_name != 'none':
-            for season in range(start, end + 1):
-                print(f"Processing {league_name} for the {season} season.")
-                data_season = scrape_league_data(league_name=league_name,
-                                                 transfermarkt_name=transfermarkt_name,
-                                                 year=season)
-                data_seasons.append(data_season)
+def seed_partitions(country, cup):
+    """
+    Split an existing `{cup}_financial_data.csv` into (league, season) partitions, so that
+    data scraped before the store existed does not have to be scraped again.
+    """
+    path = financial_data_path(country, cup)
+    if not os.path.exists(path) or os.path.isdir(os.path.join(project_root(), 'data', 'process', country,
+                                                              'financial')):
+        return
+
+    print(f"Seeding financial partitions from {path}")
+    financial_data = pd.read_csv(path)
+    for (league_name, season), partition in financial_data.groupby(['league', 'year']):
+        save_partition(partition, country, league_name, season)
+
+
+def request_financial_data(country, cup, workers=4, rate=1.0, offline=False, refresh=False, cache=None,
+                           base_url=TRANSFERMARKT_URL):
+    """
+    Update the partitioned financial store of a country and rebuild `{cup}_financial_data.csv`.
+
+    Every (league, season) in the country mapping is stored as its own partition under
+    data/process/<country>/financial/. Only partitions that are missing, or belong to a
+    season that is still open, are scraped, at up to `workers` concurrent pages and `rate`
+    requests per second, so the yearly update costs one page per league. refresh=True
+    scrapes every partition again. `base_url` can point the scraper at a local stand-in
+    server (see data/financial/standin.py).
+
+    Pages are kept in a PageCache: closed seasons fetched after they ended are served from
+    the cache without a request, while open seasons and closed seasons fetched mid-season
+    are revalidated once with ETag/Last-Modified. With offline=True every partition is
+    rebuilt from cached pages only.
+    """
+    cache = cache or PageCache()
+    seed_partitions(country, cup)
+
+    partitions = league_seasons(country)
+    jobs = []
+    parsed = 0
+    for league_name, season, transfermarkt_name in partitions:
+        url = league_url(transfermarkt_name, season, base_url)
+        entry = cache.lookup(url, season)
+
+        # Closed seasons are skipped unless their page was fetched before the season ended;
+        # seeded partitions have no page and are kept as they are
+        stored = os.path.exists(partition_path(country, league_name, season))
+        if (stored and cache.is_closed(season) and (entry is None or cache.is_final(entry))
+                and not (refresh or offline)):
+            continue
+
+        if entry is not None and (offline or cache.is_final(entry)):
+            data_season = parse_league_page(cache.load(entry), league_name, season)
+            if not data_season.empty:
+                save_partition(data_season, country, league_name, season)
+                parsed += 1
+        elif offline:
+            print(f"No cached page for {league_name} in {season}, skipping in offline mode.")
+        else:
+            jobs.append({'league_name': league_name,
+                         'year': season,
+                         'url': url,
+                         'entry': entry,
+                         'headers': cache.conditional_headers(entry)})
+
+    print(f'Parsed {parsed} league seasons from cache, requesting {len(jobs)} league seasons')
+
+    def handle(job, response):
+        print(f"Processing {job['league_name']} for the {job['year']} season.")
+        if response.status_code == 304:
+            cache.revalidated(job['entry'])
+            content = cache.load(job['entry'])
+        else:
+            cache.store(job['url'], job['year'], response)
+            content = response.content
+        data_season = parse_league_page(content, job['league_name'], job['year'])
+        if not data_season.empty:
+            save_partition(data_season, country, job['league_name'], job['year'])
+
+    if jobs:
+        engine = ScrapeEngine(workers=workers, rate=rate)
+        _, failed = engine.run(jobs, handle)
+        for job in failed:
+            print(f"Missing financial data for {job['league_name']} in {job['year']}.")
 
+    # Merge the partitions in the league and season order of the mapping
+    data_seasons = [pd.read_csv(partition_path(country, league_name, season))
+                    for league_name, season, _ in partitions
+                    if os.path.exists(partition_path(country, league_name, season))]
     financial_data = pd.concat(data_seasons, ignore_index=True)
 
     # Save financial data to CSV
-    output_path = os.path.join(project_root(),
-                               'data',
-                               'process',
-                               country,
-                               f'{cup}_financial_data.csv')
+    output_path = financial_data_path(country, cup)
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     financial_data.to_csv(output_path, index=False)
     print(f"Saved financial data to {output_path}")
@@ -1,6 +1,7 @@
 import requests
 import pandas as pd
 from bs4 import BeautifulSoup
+import lxml.html
 import re
 import time
 
@@ -22,70 +23,182 @@ def clean_value(value):
     return num_value
 
 
-def scrape_league_data(league_name, transfermarkt_name, year, retries=3, delay=5):
-    # Construct the URL based on the league and year
-    url = f'https://www.transfermarkt.com/{transfermarkt_name[0]}/startseite/wettbewerb/' \
-          f'{transfermarkt_name[1]}/plus/?saison_id={year}'
-
-    # Define headers to mimic a browser request
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1'
-    }
+# Market values like '€1.05bn', '€450k', '€10.50m', '10,50 Mio. €' or '450 Th. €'
+MARKET_VALUE_PATTERN = (r'^\s*[€$£]?\s*(?P<number>\d+(?:[.,]\d+)?)\s*'
+                        r'(?P<unit>bn|mrd\.?|m|mio\.?|k|th\.?|tsd\.?)?\s*[€$£]?\s*$')
 
-    attempt = 0
-    while attempt < retries:
-        try:
-            # Send a GET request to the webpage with a timeout
-            response = requests.get(url, headers=headers, timeout=30)
-            # Check if the request was successful
-            response.raise_for_status()
+# Multipliers and divisors converting each magnitude unit to millions. Thousands are divided
+# rather than multiplied by 0.001, so the results are the same floats as those of clean_value
+MARKET_VALUE_MULTIPLIERS = {'bn': 1000, 'mrd': 1000, 'm': 1, 'mio': 1, 'k': 1, 'th': 1, 'tsd': 1, '': 1}
+MARKET_VALUE_DIVISORS = {'bn': 1, 'mrd': 1, 'm': 1, 'mio': 1, 'k': 1000, 'th': 1000, 'tsd': 1000, '': 1}
 
-            # Parse the content of the webpage
-            soup = BeautifulSoup(response.content, 'html.parser')
 
-            # Find the table containing the data
-            table = soup.find('table', {'class': 'items'})
+def normalize_market_values(values):
+    """
+    Convert a column of market value strings to millions in one vectorized pass.
+    Values without a unit are taken to be in millions, as in clean_value.
 
-            if table:
-                # Extract table headers
-                headers = [header.text.strip() for header in table.find_all('th')]
+    Returns:
+    - pd.Series: Market values in millions, NaN where a cell could not be parsed.
+    - pd.Series: Boolean flags marking the unparseable cells.
+    """
+    # Parse each distinct string once and broadcast the result back to the column
+    codes, uniques = pd.factorize(values.astype(str))
+    parts = pd.Series(uniques, dtype=object).str.extract(MARKET_VALUE_PATTERN, flags=re.IGNORECASE)
+    numbers = pd.to_numeric(parts['number'].str.replace(',', '.', regex=False), errors='coerce')
+    units = parts['unit'].fillna('').str.lower().str.rstrip('.')
+    numbers = numbers * units.map(MARKET_VALUE_MULTIPLIERS) / units.map(MARKET_VALUE_DIVISORS)
 
-                # Extract table rows
-                rows = []
-                for row in table.find_all('tr')[2:]:  # Skipping the first two rows: header row and average row
-                    cells = row.find_all('td')
-                    if len(cells) > 1:
-                        row_data = [cell.text.strip() for cell in cells]
-                        rows.append(row_data)
+    millions = pd.Series(numbers.to_numpy()[codes], index=values.index, dtype=float)
+    return millions, millions.isna()
 
-                # Create a DataFrame from the extracted data
-                df = pd.DataFrame(rows, columns=headers)
 
-                # Clean and convert the 'ø market value' and 'Total market value' columns
-                df['ø market value'] = df['ø market value'].apply(clean_value)
-                df['Total market value'] = df['Total market value'].apply(clean_value)
+# Define headers to mimic a browser request
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
 
-                # Add the 'year' column
-                df['year'] = year
-                df['league'] = league_name
 
-                df.drop(['Club'], axis=1, inplace=True)
+TRANSFERMARKT_URL = 'https://www.transfermarkt.com'
 
-                df.columns = ['team_name', 'team_size', 'mean_age', 'foreigners', 'mean_value', 'total_value', 'year',
-                              'league']
-                df = df[
-                    ['year', 'league', 'team_name', 'team_size', 'mean_age', 'foreigners', 'mean_value', 'total_value']]
 
-                return df
+def league_url(transfermarkt_name, year, base_url=TRANSFERMARKT_URL):
+    # Construct the URL based on the league and year
+    return f'{base_url}/{transfermarkt_name[0]}/startseite/wettbewerb/' \
+           f'{transfermarkt_name[1]}/plus/?saison_id={year}'
+
+
+# Schema of the club overview table: output column, pattern matching the header text and the
+# offset of the cell relative to the header (the club header covers the crest and the name cell)
+FINANCIAL_SCHEMA = [
+    ('team_name', r'^club$', 1),
+    ('team_size', r'^squad$', 0),
+    ('mean_age', r'age$', 0),
+    ('foreigners', r'^foreigners$', 0),
+    ('mean_value', r'^ø\s*market value$', 0),
+    ('total_value', r'^total market value$', 0),
+]
+
+FINANCIAL_COLUMNS = ['year', 'league', 'team_name', 'team_size', 'mean_age', 'foreigners', 'mean_value', 'total_value']
+
+
+def resolve_schema(headers, schema=FINANCIAL_SCHEMA):
+    """
+    Map output columns to cell positions by matching header texts against the schema.
+    Raises a ValueError when a column cannot be found, instead of silently shifting columns.
+    """
+    positions = {}
+    for column, pattern, offset in schema:
+        matches = [i for i, header in enumerate(headers) if re.search(pattern, header.strip(), re.IGNORECASE)]
+        if not matches:
+            raise ValueError(f"Column '{column}' not found in table headers {headers}")
+        positions[column] = matches[0] + offset
+    return positions
+
+
+def parse_league_page(content, league_name, year):
+    """
+    Parse the club overview table of a Transfermarkt league page with lxml, targeting
+    the `table.items` element directly and mapping columns through FINANCIAL_SCHEMA.
+
+    Returns:
+    - pd.DataFrame: Financial data per team, or an empty DataFrame when the table is missing.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    tree = lxml.html.fromstring(content, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    tables = tree.xpath('//table[contains(concat(" ", normalize-space(@class), " "), " items ")]')
+
+    if not tables:
+        print(f"Failed to find the table on the webpage for {league_name} in {year}.")
+        return pd.DataFrame()
+
+    table = tables[0]
+    headers = [header.text_content().strip() for header in table.iter('th')]
+    positions = resolve_schema(headers)
+
+    columns = {column: [] for column in positions}
+    for row in list(table.iter('tr'))[2:]:  # Skipping the first two rows: header row and average row
+        cells = row.findall('td')
+        if len(cells) > 1:
+            for column, position in positions.items():
+                columns[column].append(cells[position].text_content().strip())
+
+    df = pd.DataFrame(columns)
+    for column in ['mean_value', 'total_value']:
+        df[column], unparseable = normalize_market_values(df[column])
+        if unparseable.any():
+            print(f"Could not parse {unparseable.sum()} {column} cells for {league_name} in {year}: "
+                  f"{df.loc[unparseable, 'team_name'].tolist()}")
+    df['year'] = year
+    df['league'] = league_name
+
+    return df[FINANCIAL_COLUMNS]
+
+
+def parse_league_page_soup(content, league_name, year):
+    """
+    Reference parser using BeautifulSoup's pure-Python html.parser and positional
+    column renames. Kept to benchmark and validate parse_league_page.
+    """
+    # Parse the content of the webpage
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Find the table containing the data
+    table = soup.find('table', {'class': 'items'})
+
+    if not table:
+        print(f"Failed to find the table on the webpage for {league_name} in {year}.")
+        return pd.DataFrame()
+
+    # Extract table headers
+    headers = [header.text.strip() for header in table.find_all('th')]
+
+    # Extract table rows
+    rows = []
+    for row in table.find_all('tr')[2:]:  # Skipping the first two rows: header row and average row
+        cells = row.find_all('td')
+        if len(cells) > 1:
+            row_data = [cell.text.strip() for cell in cells]
+            rows.append(row_data)
+
+    # Create a DataFrame from the extracted data
+    df = pd.DataFrame(rows, columns=headers)
+
+    # Clean and convert the 'ø market value' and 'Total market value' columns
+    df['ø market value'] = df['ø market value'].apply(clean_value)
+    df['Total market value'] = df['Total market value'].apply(clean_value)
+
+    # Add the 'year' column
+    df['year'] = year
+    df['league'] = league_name
+
+    df.drop(['Club'], axis=1, inplace=True)
+
+    df.columns = ['team_name', 'team_size', 'mean_age', 'foreigners', 'mean_value', 'total_value', 'year',
+                  'league']
+    df = df[FINANCIAL_COLUMNS]
+
+    return df
+
+
+def scrape_league_data(league_name, transfermarkt_name, year, retries=3, delay=5, session=None):
+    url = league_url(transfermarkt_name, year)
+    get = session.get if session is not None else requests.get
 
-            else:
-                print(f"Failed to find the table on the webpage for {league_name} in {year}.")
-                return pd.DataFrame()
+    attempt = 0
+    while attempt < retries:
+        try:
+            # Send a GET request to the webpage with a timeout
+            response = get(url, headers=HEADERS, timeout=30)
+            # Check if the request was successful
+            response.raise_for_status()
+            return parse_league_page(response.content, league_name, year)
 
         except requests.exceptions.RequestException as e:
             print(f"Request failed for {league_name} in {year}: {e}. Retrying in {delay} seconds...")
@@ -94,12 +207,3 @@ def scrape_league_data(league_name, transfermarkt_name, year, retries=3, delay=5
 
     print(f"Failed to retrieve data for {league_name} in {year} after {retries} attempts.")
     return pd.DataFrame()
-
-# Example usage
-# league = 'bundesliga'
-# year = 2022
-# df = scrape_league_data(league, year)
-# print(df)
-
-# Save DataFrame to CSV (optional)
-# df.to_csv(f'{league}_table_{year}.csv', index=False)
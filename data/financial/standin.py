@@ -0,0 +1,224 @@
+import hashlib
+import html
+import os
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+from data.financial.cache import PageCache
+from data.financial.engine import ScrapeEngine
+from data.financial.loader import financial_data_path, league_seasons
+from data.financial.scrape import FINANCIAL_COLUMNS, league_url, parse_league_page
+from utils.load import load_mappings_from_yaml, project_root
+from utils.ratelimit import RateLimiter
+
+LEAGUE_PATH = re.compile(r'^/(?P<slug>[^/]+)/startseite/wettbewerb/(?P<code>[^/]+)/plus/?$')
+
+
+def format_market_value(value):
+    # Render a value in millions the way Transfermarkt displays it
+    if value >= 1000:
+        return f'€{value / 1000:.2f}bn'
+    elif value >= 1:
+        return f'€{value:.2f}m'
+    return f'€{value * 1000:.0f}k'
+
+
+def render_league_page(financial_data, padding=2000):
+    """
+    Render financial data as a Transfermarkt-like club overview page. `padding` adds
+    navigation markup around the table so parse times resemble a full page.
+
+    Returns:
+    - bytes: UTF-8 encoded HTML page.
+    """
+    navigation = ''.join(f'<div class="navigation"><a href="/link/{i}">Link {i}</a></div>' for i in range(padding))
+    rows = ''.join(
+        f'<tr class="odd"><td class="zentriert"><img src="crest.png"></td>'
+        f'<td class="hauptlink"><a href="/club">{html.escape(str(row.team_name))}</a></td>'
+        f'<td class="zentriert">{row.team_size}</td><td class="zentriert">{row.mean_age}</td>'
+        f'<td class="zentriert">{row.foreigners}</td><td class="rechts">{format_market_value(row.mean_value)}</td>'
+        f'<td class="rechts">{format_market_value(row.total_value)}</td></tr>'
+        for row in financial_data.itertuples(index=False))
+
+    page = ('<html><head><meta charset="utf-8"></head><body>' + navigation +
+            '<div class="responsive-table"><table class="items"><thead><tr>'
+            '<th>Club</th><th>name</th><th>Squad</th><th>ø age</th><th>Foreigners</th>'
+            '<th>ø market value</th><th>Total market value</th></tr></thead><tbody>'
+            '<tr><td></td><td></td><td>Ø</td><td></td><td></td><td></td><td></td></tr>' + rows +
+            '</tbody></table></div>' + navigation + '</body></html>')
+    return page.encode('utf-8')
+
+
+class TransfermarktStandIn:
+    """
+    Local HTTP stand-in for the Transfermarkt `startseite/wettbewerb` pages of a country.
+
+    Pages are either recorded pages from the PageCache (source='recorded') or rendered
+    from the country's financial data (source='template'), so parsed results can be
+    checked against the data they were rendered from. The server can add `latency`
+    seconds per request, answer a fraction `error_rate` of requests with a 503, and
+    answer requests above `rate_limit` per second with a 429 and a Retry-After header.
+    Responses carry an ETag and honour If-None-Match.
+    """
+
+    def __init__(self, country, source='template', latency=0.0, error_rate=0.0, rate_limit=None, retry_after=1,
+                 financial_data=None, cache=None, seed=0, port=0):
+        self.country = country
+        self.source = source
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.limiter = RateLimiter(rate_limit, burst=max(1, int(rate_limit or 1)))
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'not_modified': 0, 'errors': 0, 'rate_limited': 0, 'not_found': 0}
+
+        self.leagues = {transfermarkt_name[1]: (league_name, transfermarkt_name)
+                        for league_name, _, transfermarkt_name in league_seasons(country)}
+        if source == 'template' and financial_data is None:
+            cup = load_mappings_from_yaml(os.path.join(project_root(), 'settings', 'mapping.yaml'))['countries'][country]
+            financial_data = pd.read_csv(financial_data_path(country, cup))
+        self.financial_data = financial_data
+        self.cache = cache or (PageCache() if source == 'recorded' else None)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def page(self, code, season):
+        if code not in self.leagues:
+            return None
+        league_name, transfermarkt_name = self.leagues[code]
+
+        if self.source == 'recorded':
+            entry = self.cache.lookup(league_url(transfermarkt_name, season), season)
+            return self.cache.load(entry) if entry else None
+
+        data = self.financial_data[(self.financial_data['league'] == league_name) &
+                                   (self.financial_data['year'] == season)]
+        return render_league_page(data) if not data.empty else None
+
+    def _count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin._count('requests')
+                if standin.latency:
+                    time.sleep(standin.latency)
+
+                if not standin.limiter.try_acquire():
+                    standin._count('rate_limited')
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(standin.retry_after))
+                    self.end_headers()
+                    return
+
+                with standin.lock:
+                    fail = standin.random.random() < standin.error_rate
+                if fail:
+                    standin._count('errors')
+                    self.send_error(503)
+                    return
+
+                url = urlparse(self.path)
+                match = LEAGUE_PATH.match(url.path)
+                season = parse_qs(url.query).get('saison_id', [''])[0]
+                content = standin.page(match['code'], int(season)) if match and season.isdigit() else None
+                if content is None:
+                    standin._count('not_found')
+                    self.send_error(404)
+                    return
+
+                etag = f'"{hashlib.sha1(content).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    standin._count('not_modified')
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                standin._count('ok')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def benchmark_scraper(country, workers=4, rate=10.0, **standin_options):
+    """
+    Scrape every league season of a country from a TransfermarktStandIn and report
+    throughput, server-side outcomes and, for templated pages, parser correctness.
+
+    Returns:
+    - dict: Benchmark summary.
+    """
+    with TransfermarktStandIn(country, **standin_options) as standin:
+        jobs = [{'league_name': league_name, 'year': season,
+                 'url': league_url(transfermarkt_name, season, standin.url)}
+                for league_name, season, transfermarkt_name in league_seasons(country)]
+
+        engine = ScrapeEngine(workers=workers, rate=rate, backoff=0.5)
+        start = time.perf_counter()
+        results, failed = engine.run(
+            jobs, lambda job, response: parse_league_page(response.content, job['league_name'], job['year']))
+        elapsed = time.perf_counter() - start
+
+        correct = None
+        if standin.source == 'template':
+            expected = standin.financial_data[FINANCIAL_COLUMNS]
+            correct = 0
+            for parsed in results:
+                league_name, season = parsed['league'].iloc[0], parsed['year'].iloc[0]
+                source = expected[(expected['league'] == league_name) & (expected['year'] == season)]
+                # The parser keeps the table cells as text, like the CSV files before they are read back
+                parsed = parsed.astype(source.dtypes.to_dict()).reset_index(drop=True)
+                if parsed.equals(source.reset_index(drop=True)):
+                    correct += 1
+
+        summary = {'pages': len(jobs), 'scraped': len(results), 'failed': len(failed), 'correct': correct,
+                   'seconds': round(elapsed, 2), 'pages_per_second': round(len(results) / elapsed, 2),
+                   **standin.stats}
+
+    print(summary)
+    return summary
+
+
+if __name__ == "__main__":
+    country = 'Germany'
+    benchmark_scraper(country, workers=4, rate=10.0, latency=0.2, error_rate=0.1, rate_limit=8)
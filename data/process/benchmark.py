@@ -0,0 +1,72 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data.process.imputation import (IMPUTE_COLUMNS, decay_rss, fit_exponential_trends,
+                                     fit_exponential_trends_curve_fit, trend_samples)
+from utils.load import project_root
+
+
+def benchmark_decay_fitters(df, target_cols=IMPUTE_COLUMNS, group_cols=('country_name', 'year'),
+                            impute_col='team_division', log_transform=False, repeat=3, tolerance=1e-3):
+    """
+    Time the batched exponential-decay fitter against one `curve_fit` per (group, target)
+    and compare their fits. Groups agree when their residual sums of squares are within
+    `tolerance` (relative); where they differ, the fit with the lower RSS is better.
+
+    Returns:
+    - dict: Mean time per call of each fitter, the speedup and agreement counts.
+    """
+    non_league_value = df[impute_col].max()
+    samples = trend_samples(df.assign(**{impute_col: df[impute_col].fillna(non_league_value)}),
+                            target_cols, impute_col, non_league_value, group_cols, log_transform)
+    keys = list(group_cols) + ['target']
+
+    timings, fits = {}, {}
+    for name, fitter in [('batched', fit_exponential_trends), ('curve_fit', fit_exponential_trends_curve_fit)]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fits[name] = fitter(samples, keys, non_league_value)
+            timings[name] = (time.perf_counter() - start) / repeat
+
+    # Residual sums of squares of both fits on the same samples
+    samples = samples.sort_values(keys, kind='stable')
+    group = samples.groupby(keys).ngroup().to_numpy()
+    x, y = samples['x'].to_numpy(), samples['y'].to_numpy()
+    rss = {name: decay_rss(fit[['a', 'b', 'c']].to_numpy().T, group, x, y, len(fit)) for name, fit in fits.items()}
+
+    # The batched fitter leaves groups with fewer than three divisions unfitted
+    fitted = np.isfinite(rss['batched']) & np.isfinite(rss['curve_fit'])
+    scale = 1 + np.abs(rss['curve_fit'])
+    agree = fitted & (np.abs(rss['batched'] - rss['curve_fit']) <= tolerance * scale)
+    prediction_gap = (fits['batched']['prediction'] - fits['curve_fit']['prediction']).abs()[agree]
+
+    summary = {
+        'groups': len(rss['batched']),
+        'batched_seconds': timings['batched'],
+        'curve_fit_seconds': timings['curve_fit'],
+        'speedup': timings['curve_fit'] / timings['batched'],
+        'agree': int(agree.sum()),
+        'batched_better': int((fitted & ~agree & (rss['batched'] < rss['curve_fit'])).sum()),
+        'curve_fit_better': int((fitted & ~agree & (rss['batched'] > rss['curve_fit'])).sum()),
+        'unidentified': int((~np.isfinite(rss['batched'])).sum()),
+        'max_prediction_gap': float(prediction_gap.max()) if len(prediction_gap) else 0.0,
+    }
+
+    print(f"Fitted {summary['groups']} (group, target) exponential decays {repeat} times")
+    print(f"batched:\t{summary['batched_seconds'] * 1000:.1f} ms")
+    print(f"curve_fit:\t{summary['curve_fit_seconds'] * 1000:.1f} ms")
+    print(f"Speedup:\t{summary['speedup']:.1f}x")
+    print(f"Agreeing fits:\t{summary['agree']}, batched better: {summary['batched_better']}, "
+          f"curve_fit better: {summary['curve_fit_better']}")
+
+    return summary
+
+
+if __name__ == "__main__":
+    combined_data = pd.read_csv(f'{project_root()}/causality/2sls_iv/data/combined_cup_processed_win.csv')
+    benchmark_decay_fitters(combined_data)
@@ -1,7 +1,7 @@
 import os
 import pandas as pd
 from utils.load import project_root, load_mappings_from_yaml, load_processed_data
-from data.process.imputation import impute_data
+from data.process.imputation_cache import cached_impute_data
 
 mapping = load_mappings_from_yaml('settings/mapping.yaml')
 
@@ -99,7 +99,7 @@ def load_and_process_cup_data():
     for country, cup in mapping['countries'].items():
         data = load_processed_data(country, cup)
 
-        data = impute_data(data, method='minmax')
+        data = cached_impute_data(data, country, method='minmax')
 
         data['country_name'] = country
         data['country_code'] = country_codes[country]
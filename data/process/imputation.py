@@ -1,18 +1,35 @@
+import os
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 import numpy as np
-import matplotlib.pyplot as plt
 
+from matplotlib.figure import Figure
 from scipy.optimize import curve_fit
 
-import matplotlib.pyplot as plt
+# Columns filled by the imputation methods
+IMPUTE_COLUMNS = ['team_size', 'foreigners', 'mean_value', 'total_value', 'mean_age']
 
 
-def minmax_impute(match_df):
+def lower_tail_values(df, col, percentile=0.05):
+    lower_bound = df[col].quantile(percentile)
+    return df[df[col] <= lower_bound][col]
+
+
+def minmax_impute(match_df, reference_df=None):
+    """
+    Impute league teams with the mean of their division in that season and non-league
+    teams with the lower tail of the lowest league division. The division means, the
+    lower-tail statistic and the fallback are estimated on `reference_df` (e.g. a
+    bootstrap sample of the rows) and applied to `match_df`; by default they are
+    estimated on `match_df` itself.
+    """
     non_league_division = match_df['team_division'].max()
     max_division = non_league_division - 1
     lowest_known_division = match_df['team_division'].min()
 
+    # The reference frame is filled along with match_df, since later statistics read the filled values
+    frames = [match_df] if reference_df is None else [reference_df.copy(), match_df]
+    reference_df = frames[0]
+
     # Define columns to impute
     min_value_columns = ['team_size', 'foreigners', 'mean_value', 'total_value']
     max_value_columns = ['mean_age']
@@ -21,52 +38,43 @@ def minmax_impute(match_df):
     def adjusted_lower_mean_zscore(df, col, percentile=0.05, z_score=-1):
         if df[col].notna().sum() == 0:  # Handle cases where no data is available
             return np.nan
-        lower_bound = df[col].quantile(percentile)
-        subset = df[df[col] <= lower_bound][col]
+        subset = lower_tail_values(df, col, percentile)
         lower_mean = subset.mean()
         lower_std = subset.std()
         adjusted_mean = lower_mean + z_score * lower_std
         return max(adjusted_mean, 0)
 
-    for col in min_value_columns:
+    def fill_division_means(col):
         # Impute missing values with the mean for league teams
-        means = match_df.groupby(['year', 'team_division'])[col].transform('mean')
-        match_df[col] = match_df[col].fillna(means)
-
-        # Debugging: Print out missing values before non-league imputation
-        print(f"Missing {col} before non-league imputation:", match_df[col].isna().sum())
-
-        # Adjust non-league teams and NaN division values
-        non_league_or_nan_teams = (match_df['team_division'] == non_league_division) | (
-            match_df['team_division'].isna())
-        match_df.loc[non_league_or_nan_teams, col] = match_df[non_league_or_nan_teams].apply(
-            lambda row:
-            adjusted_lower_mean_zscore(
-                match_df[(match_df['year'] == row['year']) & (match_df['team_division'] == max_division)], col
-            )
-            if row['year'] in match_df['year'].unique() else np.nan,
-            axis=1
-        )
+        means = reference_df.groupby(['year', 'team_division'])[col].mean()
+        for df in frames:
+            keys = pd.MultiIndex.from_frame(df[['year', 'team_division']])
+            df[col] = df[col].fillna(pd.Series(means.reindex(keys).to_numpy(), index=df.index))
 
+    def fill_lowest_division_mean(col):
         # Fallback: Take the mean of the lowest known division for any remaining NaNs
-        lowest_division_mean = match_df[match_df['team_division'] == lowest_known_division][col].mean()
-        match_df[col] = match_df[col].fillna(lowest_division_mean)
+        lowest_division_mean = reference_df[reference_df['team_division'] == lowest_known_division][col].mean()
+        for df in frames:
+            df[col] = df[col].fillna(lowest_division_mean)
 
-        # Debugging: Print out missing values after fallback imputation
-        print(f"Missing {col} after using lowest division mean:", match_df[col].isna().sum())
+    for col in min_value_columns:
+        fill_division_means(col)
 
-    # Handle max_value_columns, specifically 'mean_age'
-    for col in max_value_columns:
-        # Impute missing values with the mean for league teams
-        means = match_df.groupby(['year', 'team_division'])[col].transform('mean')
-        match_df[col] = match_df[col].fillna(means)
+        # Adjust non-league teams and NaN division values with the lowest league division's
+        # lower-tail statistic, computed once per year and broadcast to the teams of that year
+        lower_tail = {year: adjusted_lower_mean_zscore(division_df, col)
+                      for year, division_df in reference_df[reference_df['team_division'] == max_division]
+                      .groupby('year')}
+        for df in frames:
+            non_league_or_nan_teams = (df['team_division'] == non_league_division) | df['team_division'].isna()
+            df.loc[non_league_or_nan_teams, col] = df.loc[non_league_or_nan_teams, 'year'].map(lower_tail).astype(float)
 
-        # Fallback: Use the mean of the lowest known division for any remaining NaNs
-        lowest_division_mean = match_df[match_df['team_division'] == lowest_known_division][col].mean()
-        match_df[col] = match_df[col].fillna(lowest_division_mean)
+        fill_lowest_division_mean(col)
 
-        # Debugging: Print out missing values after fallback imputation
-        print(f"Missing {col} after using lowest division mean:", match_df[col].isna().sum())
+    # Handle max_value_columns, specifically 'mean_age'
+    for col in max_value_columns:
+        fill_division_means(col)
+        fill_lowest_division_mean(col)
 
     return match_df
 
@@ -77,86 +85,304 @@ def drop_nan_impute(match_df):
     return match_df
 
 
-def impute_data(match_df, method='minmax'):
+def impute_data_with_fits(match_df, method='minmax'):
+    """
+    Impute like `impute_data`, also returning the fitted division trends of the
+    'regression' and 'exponential' methods (None for the other methods).
+    """
+    fits = None
     if method == 'minmax':
         match_df = minmax_impute(match_df)
 
     elif method == 'drop':
         match_df = match_df.dropna(subset=['team_division', 'league'])
+    elif method in ('regression', 'exponential'):
+        # Fit the division trend separately per country and season
+        group_cols = [col for col in ('country_name', 'year') if col in match_df]
+        match_df, fits = division_trend_impute(match_df, IMPUTE_COLUMNS,
+                                               model='linear' if method == 'regression' else 'exponential',
+                                               group_cols=group_cols)
     else:
         match_df = match_df
 
+    return match_df, fits
+
+
+def impute_data(match_df, method='minmax'):
+    match_df, _ = impute_data_with_fits(match_df, method)
     return match_df
 
 
-def regression_impute(df, target_col, impute_col, fill_value, non_league_value, log_transform=False):
+def exponential_decay(x, a, b, c):
+    return a * np.exp(-b * x) + c
+
+
+def trend_samples(df, target_cols, impute_col, non_league_value, group_cols, log_transform):
     """
-    Perform regression imputation by extrapolation for a target column based on an impute column.
+    Stack the league rows of every target column into one long frame with columns
+    group_cols + ['target', 'x', 'y'], so all (group, target) fits run together.
+    """
+    league_teams = df[df[impute_col] != non_league_value]
+    samples = (league_teams[list(group_cols) + [impute_col] + list(target_cols)]
+               .melt(id_vars=list(group_cols) + [impute_col], var_name='target', value_name='y')
+               .rename(columns={impute_col: 'x'})
+               .dropna(subset=['y']))
+    samples['x'] = samples['x'].astype(float)
+    samples['y'] = samples['y'].astype(float)
+    if log_transform:
+        samples['y'] = np.log1p(samples['y'])  # log1p is used to handle zero values
+    return samples
+
+
+def fit_linear_trends(samples, keys, non_league_value):
+    """
+    Least-squares line per (group, target) from grouped sums, matching
+    `LinearRegression` (a flat line through the mean when x does not vary).
+    """
+    samples = samples.assign(xx=samples['x'] ** 2, xy=samples['x'] * samples['y'])
+    sums = samples.groupby(keys)[['x', 'y', 'xx', 'xy']].sum()
+    n = samples.groupby(keys).size()
+
+    sxx = sums['xx'] - sums['x'] ** 2 / n
+    sxy = sums['xy'] - sums['x'] * sums['y'] / n
+    slope = (sxy / sxx).where(sxx > 1e-12 * sums['xx'], 0.0)
+    intercept = (sums['y'] - slope * sums['x']) / n
+
+    return pd.DataFrame({'n': n, 'intercept': intercept, 'slope': slope,
+                         'prediction': intercept + slope * non_league_value}).reset_index()
+
+
+def fit_exponential_trends_curve_fit(samples, keys, non_league_value):
+    """
+    Reference fitter: one `curve_fit` per (group, target). Groups whose fit does not
+    converge get no prediction.
+    """
+    fits = []
+    for key, group in samples.groupby(keys if len(keys) > 1 else keys[0]):
+        try:
+            params, _ = curve_fit(exponential_decay, group['x'].to_numpy(), group['y'].to_numpy(), maxfev=10000)
+        except (RuntimeError, TypeError):
+            params = np.full(3, np.nan)
+        key = key if isinstance(key, tuple) else (key,)
+        fits.append((*key, len(group), *params, exponential_decay(non_league_value, *params)))
+
+    return pd.DataFrame(fits, columns=list(keys) + ['n', 'a', 'b', 'c', 'prediction'])
+
+
+# Decay rates scanned for every group, and the window scanned around the previous
+# season's rate when a fit is warm started
+DECAY_RATE_GRID = np.linspace(-2, 10, 121)
+WARM_START_WINDOW = np.linspace(-0.2, 0.2, 21)
+GOLDEN_SECTION_STEPS = 60
+
+
+def profile_decay(b, group, x, y, w, n_groups):
+    """
+    For decay rates `b` per group, the weighted least-squares `a` and `c` of
+    `a * exp(-b * x) + c` in closed form, and the residual sum of squares.
+    """
+    u = np.exp(-b[group] * x)
+    n = np.bincount(group, w, n_groups)
+    su = np.bincount(group, w * u, n_groups)
+    suu = np.bincount(group, w * u * u, n_groups)
+    sy = np.bincount(group, w * y, n_groups)
+    suy = np.bincount(group, w * u * y, n_groups)
+    syy = np.bincount(group, w * y * y, n_groups)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_u = suu - su ** 2 / n
+        cov_uy = suy - su * sy / n
+        a = np.where(var_u > 1e-12 * suu, cov_uy / var_u, np.nan)
+        c = (sy - a * su) / n
+        rss = syy - sy ** 2 / n - a * cov_uy
+    return a, c, np.where(np.isnan(rss), np.inf, rss)
+
+
+def decay_rss(params, group, x, y, n_groups, w=None):
+    residuals = y - exponential_decay(x, *(param[group] for param in params))
+    return np.bincount(group, residuals ** 2 * (1 if w is None else w), n_groups)
+
+
+def solve_decay_batch(group, x, y, w, n_groups, start_b=None):
+    """
+    Fit `a * exp(-b * x) + c` for all groups at once on weighted samples by profiling
+    out `a` and `c`: the residual sum of squares is scanned over DECAY_RATE_GRID, plus
+    a fine window around `start_b` for groups with a finite warm start, and the best
+    rate is refined by golden-section search in its bracket.
+
+    Returns:
+    - np.ndarray: Parameters a, b, c per group, shape (3, n_groups).
+    """
+    start_b = np.full(n_groups, np.nan) if start_b is None else start_b.astype(float)
+    warm = np.isfinite(start_b)
+    spacing = np.full(n_groups, DECAY_RATE_GRID[1] - DECAY_RATE_GRID[0])
+
+    best_b, best_rss = np.zeros(n_groups), np.full(n_groups, np.inf)
+    candidates = [(np.full(n_groups, rate), np.ones(n_groups, dtype=bool)) for rate in DECAY_RATE_GRID]
+    if warm.any():
+        candidates += [(np.nan_to_num(start_b) + offset, warm) for offset in WARM_START_WINDOW]
+    for rate, scanned in candidates:
+        _, _, rss = profile_decay(rate, group, x, y, w, n_groups)
+        improved = scanned & (rss < best_rss)
+        best_b[improved], best_rss[improved] = rate[improved], rss[improved]
+
+    # Search the finer window spacing if the best rate came from the warm start window
+    in_window = warm & (np.abs(best_b - start_b) <= np.abs(WARM_START_WINDOW).max() + 1e-12)
+    spacing[in_window] = WARM_START_WINDOW[1] - WARM_START_WINDOW[0]
+
+    # Golden-section search of the profiled residual sum of squares around the best grid rate
+    ratio = (np.sqrt(5) - 1) / 2
+    left, right = best_b - spacing, best_b + spacing
+    inner_left, inner_right = right - ratio * (right - left), left + ratio * (right - left)
+    rss_left = profile_decay(inner_left, group, x, y, w, n_groups)[2]
+    rss_right = profile_decay(inner_right, group, x, y, w, n_groups)[2]
+    for _ in range(GOLDEN_SECTION_STEPS):
+        # Keep the side of the better inner point; its inner point is reused and one new point is evaluated
+        go_left = rss_left < rss_right
+        left, right = np.where(go_left, left, inner_left), np.where(go_left, inner_right, right)
+        inner_left, inner_right = (np.where(go_left, right - ratio * (right - left), inner_right),
+                                   np.where(go_left, inner_left, left + ratio * (right - left)))
+        rss_new = profile_decay(np.where(go_left, inner_left, inner_right), group, x, y, w, n_groups)[2]
+        rss_left, rss_right = np.where(go_left, rss_new, rss_right), np.where(go_left, rss_left, rss_new)
+
+    b = (left + right) / 2
+    a, c, rss = profile_decay(b, group, x, y, w, n_groups)
+    # Keep the grid rate if the search did not improve on it, e.g. at the edge of the range
+    a_grid, c_grid, _ = profile_decay(best_b, group, x, y, w, n_groups)
+    use_grid = best_rss < rss
+    params = np.vstack([np.where(use_grid, a_grid, a), np.where(use_grid, best_b, b), np.where(use_grid, c_grid, c)])
+    params[:, ~np.isfinite(np.minimum(best_rss, rss))] = np.nan
+    return params
+
+
+def fit_exponential_trends(samples, keys, non_league_value, previous_fits=None, season_col='year'):
+    """
+    Exponential decay `a * exp(-b * x) + c` per (group, target), fitted for all groups
+    simultaneously. Samples are reduced to their mean per division with the division's
+    size as weight, which leaves the least-squares fit unchanged. Fits of earlier
+    seasons in `previous_fits` (the fits table of an earlier call) warm start the same
+    group's next season.
+
+    The decay is only identified by at least three divisions; groups with fewer get
+    no prediction.
+    """
+    divisions = samples.groupby(keys + ['x'])['y'].agg(['mean', 'size']).reset_index()
+    fits = divisions.groupby(keys).agg(n=('size', 'sum'), divisions=('x', 'size')).reset_index()
+    group = divisions.groupby(keys).ngroup().to_numpy()
+    x, y, w = (divisions[column].to_numpy(dtype=float) for column in ('x', 'mean', 'size'))
+
+    start_b = None
+    if previous_fits is not None and season_col in keys:
+        previous = previous_fits.dropna(subset=['b']).assign(**{season_col: previous_fits[season_col] + 1})
+        start_b = fits[keys].merge(previous[keys + ['b']], on=keys, how='left')['b'].to_numpy()
+
+    params = solve_decay_batch(group, x, y, w, len(fits), start_b)
+    params[:, (fits['divisions'] < 3).to_numpy()] = np.nan
+
+    fits['a'], fits['b'], fits['c'] = params
+    fits['prediction'] = exponential_decay(non_league_value, *params)
+    return fits.drop(columns=['divisions'])
+
+
+def division_trend_impute(df, target_cols, impute_col='team_division', fill_value=None, non_league_value=None,
+                          model='linear', log_transform=False, group_cols=(), previous_fits=None,
+                          diagnostics_dir=None):
+    """
+    Impute target columns for non-league teams by extrapolating a trend over divisions,
+    fitted on the league teams. One call fits every target column in every group
+    defined by `group_cols` (e.g. ('country_name', 'year')), without plotting.
 
     Args:
     df (pd.DataFrame): DataFrame containing the data.
-    target_col (str): The name of the column to be imputed.
+    target_cols (list): Columns to be imputed.
     impute_col (str): The name of the column to use for the imputation.
-    fill_value: The value to replace NaNs in the impute column.
-    non_league_value: The value that indicates non-league teams.
-    log_transform: Apply log transformation if True.
+    fill_value: The value to replace NaNs in the impute column, defaults to `non_league_value`.
+    non_league_value: The value that indicates non-league teams, defaults to the highest value of `impute_col`.
+    model (str): 'linear' for a regression line or 'exponential' for an exponential decay.
+    log_transform: Fit on log1p of the targets if True.
+    group_cols (tuple): Columns defining the groups fitted separately; empty for one fit per target.
+    previous_fits (pd.DataFrame): Fits of earlier seasons to warm start exponential fits from.
+    diagnostics_dir (str): If set, a plot of every fit is saved in this directory.
 
     Returns:
     pd.DataFrame: DataFrame with the imputed values.
+    pd.DataFrame: One row per (group, target) with the fitted parameters and the imputed value.
     """
     # Avoid SettingWithCopyWarning
     df = df.copy()
 
-    # Prepare data by replacing NaN in impute_col with a fill value
+    if non_league_value is None:
+        non_league_value = df[impute_col].max()
+    if fill_value is None:
+        fill_value = non_league_value
     df[impute_col] = df[impute_col].fillna(fill_value)
 
-    # Separate league and non-league teams
-    league_teams = df[(df[impute_col] != non_league_value) & df[target_col].notna()]
-    non_league_teams = df[df[impute_col] == non_league_value]
-
-    # Prepare the regression model
-    X = league_teams[[impute_col]]
-    y = league_teams[target_col]
+    keys = list(group_cols) + ['target']
+    samples = trend_samples(df, target_cols, impute_col, non_league_value, group_cols, log_transform)
+    if model == 'linear':
+        fits = fit_linear_trends(samples, keys, non_league_value)
+    elif model == 'exponential':
+        fits = fit_exponential_trends(samples, keys, non_league_value, previous_fits)
+    else:
+        raise ValueError(f"Unknown division trend model: {model}")
 
-    # Apply log transformation if specified
-    if log_transform:
-        y = np.log1p(y)  # log1p is used to handle zero values
-
-    # Train the regression model
-    model = LinearRegression()
-    model.fit(X, y)
-
-    # Predict and impute the missing values for non-league teams (division 4)
-    predicted_values = model.predict([[non_league_value]])
-
-    # Plot division vs. target_col with regression line
-    plt.figure(figsize=(8, 6))
-    plt.scatter(X, y, label='League Teams')
-    plt.plot([1, 2, 3, non_league_value], model.predict([[1], [2], [3], [non_league_value]]), color='red',
-             label='Regression Line')
-    plt.scatter([non_league_value], predicted_values, color='green', label='Predicted Value for Division 4', zorder=5)
-    plt.xlabel(impute_col)
-    plt.ylabel(target_col)
-    plt.title(f'Division vs. {target_col} with Regression Line and Predicted Value')
-    plt.legend()
-    plt.show()
-
-    # Revert log transformation if applied
     if log_transform:
-        predicted_values = np.expm1(predicted_values)  # expm1 to revert log1p transformation
+        fits['prediction'] = np.expm1(fits['prediction'])  # expm1 to revert log1p transformation
 
-    df.loc[non_league_teams.index, target_col] = predicted_values[0]
-
-    return df
+    # Broadcast the prediction of every (group, target) to the non-league teams of its group
+    non_league_teams = df[impute_col] == non_league_value
+    non_league_groups = df.loc[non_league_teams, list(group_cols)]
+    for col in target_cols:
+        col_fits = fits[fits['target'] == col]
+        if group_cols:
+            values = non_league_groups.merge(col_fits, on=list(group_cols), how='left')['prediction'].to_numpy()
+        else:
+            values = col_fits['prediction'].iloc[0] if len(col_fits) else np.nan
+        df.loc[non_league_teams, col] = values
 
+    if diagnostics_dir is not None:
+        plot_division_trends(samples, fits, model, non_league_value, log_transform, keys, diagnostics_dir)
 
-def exponential_decay(x, a, b, c):
-    return a * np.exp(-b * x) + c
+    return df, fits
 
 
-def exponential_decay_impute(df, target_col, impute_col, fill_value, non_league_value, log_transform=False):
+def plot_division_trends(samples, fits, model, non_league_value, log_transform, keys, output_dir):
     """
-    Perform imputation using an exponential decay model for a target column based on an impute column.
+    Save a plot of the league teams, the fitted trend and the imputed value for every
+    (group, target) fit. Figures are rendered off-screen, so no GUI backend is needed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    samples = samples.set_index(keys).sort_index()
+    x_plot = np.linspace(1, non_league_value, 100)
+
+    for fit in fits.itertuples(index=False):
+        key = tuple(getattr(fit, column) for column in keys)
+        group = samples.loc[key if len(keys) > 1 else key[0]]
+        y = np.expm1(group['y']) if log_transform else group['y']
+        if model == 'linear':
+            trend = fit.intercept + fit.slope * x_plot
+        else:
+            trend = exponential_decay(x_plot, fit.a, fit.b, fit.c)
+        if log_transform:
+            trend = np.expm1(trend)
+
+        figure = Figure(figsize=(8, 6))
+        axis = figure.subplots()
+        axis.scatter(group['x'], y, label='League Teams')
+        axis.plot(x_plot, trend, color='red', label='Division Trend')
+        axis.scatter([non_league_value], [fit.prediction], color='green', label='Predicted Value for Non-League',
+                     zorder=5)
+        axis.set_xlabel('division')
+        axis.set_ylabel(key[-1])
+        axis.set_title(f'Division vs. {key[-1]} ({", ".join(map(str, key[:-1])) or "all"})')
+        axis.legend()
+        figure.savefig(os.path.join(output_dir, '_'.join(map(str, key)) + '.png'), bbox_inches='tight')
+
+
+def regression_impute(df, target_col, impute_col, fill_value, non_league_value, log_transform=False,
+                      diagnostics_dir=None):
+    """
+    Perform regression imputation by extrapolation for a target column based on an impute column.
 
     Args:
     df (pd.DataFrame): DataFrame containing the data.
@@ -165,51 +391,33 @@ def exponential_decay_impute(df, target_col, impute_col, fill_value, non_league_
     fill_value: The value to replace NaNs in the impute column.
     non_league_value: The value that indicates non-league teams.
     log_transform: Apply log transformation if True.
+    diagnostics_dir: Directory to save a plot of the fit in, if set.
 
     Returns:
     pd.DataFrame: DataFrame with the imputed values.
     """
-    # Avoid SettingWithCopyWarning
-    df = df.copy()
-
-    # Prepare data by replacing NaN in impute_col with a fill value
-    df[impute_col] = df[impute_col].fillna(fill_value)
-
-    # Separate league and non-league teams
-    league_teams = df[(df[impute_col] != non_league_value) & df[target_col].notna()]
-    non_league_teams = df[df[impute_col] == non_league_value]
-
-    # Prepare the data for curve fitting
-    X = league_teams[impute_col].values
-    y = league_teams[target_col].values
-
-    # Apply log transformation if specified
-    if log_transform:
-        y = np.log1p(y)  # log1p is used to handle zero values
+    df, _ = division_trend_impute(df, [target_col], impute_col, fill_value, non_league_value, model='linear',
+                                  log_transform=log_transform, diagnostics_dir=diagnostics_dir)
+    return df
 
-    # Fit the exponential decay model
-    params, _ = curve_fit(exponential_decay, X, y, maxfev=10000)
 
-    # Predict and impute the missing values for non-league teams (division 4)
-    predicted_value = exponential_decay(non_league_value, *params)
+def exponential_decay_impute(df, target_col, impute_col, fill_value, non_league_value, log_transform=False,
+                             diagnostics_dir=None):
+    """
+    Perform imputation using an exponential decay model for a target column based on an impute column.
 
-    # Revert log transformation if applied
-    if log_transform:
-        predicted_value = np.expm1(predicted_value)  # expm1 to revert log1p transformation
-        y = np.expm1(y)  # Revert y values for correct plotting
-
-    # Plot division vs. target_col with exponential decay curve
-    plt.figure(figsize=(8, 6))
-    plt.scatter(X, y, label='League Teams')
-    X_plot = np.linspace(1, non_league_value, 100)
-    plt.plot(X_plot, exponential_decay(X_plot, *params), color='red', label='Exponential Decay Model')
-    plt.scatter([non_league_value], [predicted_value], color='green', label='Predicted Value for Division 4', zorder=5)
-    plt.xlabel(impute_col)
-    plt.ylabel(target_col)
-    plt.title(f'Division vs. {target_col} with Exponential Decay Model and Predicted Value')
-    plt.legend()
-    plt.show()
-
-    df.loc[non_league_teams.index, target_col] = predicted_value
+    Args:
+    df (pd.DataFrame): DataFrame containing the data.
+    target_col (str): The name of the column to be imputed.
+    impute_col (str): The name of the column to use for the imputation.
+    fill_value: The value to replace NaNs in the impute column.
+    non_league_value: The value that indicates non-league teams.
+    log_transform: Apply log transformation if True.
+    diagnostics_dir: Directory to save a plot of the fit in, if set.
 
+    Returns:
+    pd.DataFrame: DataFrame with the imputed values.
+    """
+    df, _ = division_trend_impute(df, [target_col], impute_col, fill_value, non_league_value, model='exponential',
+                                  log_transform=log_transform, diagnostics_dir=diagnostics_dir)
     return df
@@ -0,0 +1,156 @@
+import datetime
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from data.process.imputation import IMPUTE_COLUMNS, impute_data_with_fits
+from utils.load import project_root
+
+# Bump when an imputation method changes its results, so stale entries are not reused
+IMPUTATION_VERSION = 1
+
+# Columns the imputation methods read; only these enter the fingerprint
+FINGERPRINT_COLUMNS = IMPUTE_COLUMNS + ['team_division', 'league', 'year', 'country_name']
+
+
+def data_fingerprint(match_df, method):
+    """
+    Hash of the columns the imputation reads and of the method configuration. Rows are
+    hashed in order, so the fingerprint also changes when rows are added, removed or
+    reordered.
+    """
+    columns = [col for col in FINGERPRINT_COLUMNS if col in match_df]
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'method': method, 'version': IMPUTATION_VERSION, 'columns': columns,
+                              'dtypes': [str(match_df[col].dtype) for col in columns]}).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(match_df[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ImputationCache:
+    """
+    On-disk cache of imputation results, partitioned per country under
+    `data/process/<country>/imputation/`. An entry is keyed by the `data_fingerprint`
+    of its input and stores only a delta: the positions of the rows the method keeps
+    and the columns it changed, plus the fitted division trends of the trend methods.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(project_root(), 'data', 'process')
+
+    def _partition(self, country):
+        return os.path.join(self.root, country, 'imputation')
+
+    def _paths(self, country, method, fingerprint):
+        stem = os.path.join(self._partition(country), f'{method}_{fingerprint[:16]}')
+        return stem + '.json', stem + '.csv', stem + '_fits.csv'
+
+    def lookup(self, country, method, fingerprint):
+        entry_path, _, _ = self._paths(country, method, fingerprint)
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, 'r') as file:
+            entry = json.load(file)
+        return entry if entry['fingerprint'] == fingerprint else None
+
+    def load(self, match_df, country, entry):
+        """
+        Apply a cached delta to the frame it was computed from.
+
+        Returns:
+        - tuple: (imputed DataFrame, fitted trends or None)
+        """
+        _, delta_path, fits_path = self._paths(country, entry['method'], entry['fingerprint'])
+        delta = pd.read_csv(delta_path, float_precision='round_trip')
+
+        imputed_df = match_df.iloc[delta['row'].to_numpy()].copy()
+        for col in entry['columns']:
+            imputed_df[col] = delta[col].to_numpy()
+        imputed_df = imputed_df.astype(entry['dtypes'])
+
+        fits = pd.read_csv(fits_path, float_precision='round_trip') if entry['has_fits'] else None
+        return imputed_df, fits
+
+    def store(self, match_df, imputed_df, fits, country, method, fingerprint):
+        entry_path, delta_path, fits_path = self._paths(country, method, fingerprint)
+        os.makedirs(self._partition(country), exist_ok=True)
+
+        # Keep the positions of the surviving rows and the columns the method changed
+        rows = match_df.index.get_indexer(imputed_df.index)
+        kept_df = match_df.iloc[rows]
+        columns = [col for col in imputed_df.columns
+                   if col not in kept_df or not kept_df[col].reset_index(drop=True)
+                   .equals(imputed_df[col].reset_index(drop=True))]
+        delta = imputed_df[columns].reset_index(drop=True)
+        delta.insert(0, 'row', rows)
+
+        self._write_csv_atomic(delta, delta_path)
+        if fits is not None:
+            self._write_csv_atomic(fits, fits_path)
+
+        entry = {
+            'method': method,
+            'fingerprint': fingerprint,
+            'columns': columns,
+            'dtypes': {col: str(imputed_df[col].dtype) for col in columns},
+            'rows': len(rows),
+            'has_fits': fits is not None,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        tmp_path = entry_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(entry, file, indent=2)
+        os.replace(tmp_path, entry_path)
+        return entry
+
+    def clear(self, country):
+        partition = self._partition(country)
+        if os.path.isdir(partition):
+            for name in os.listdir(partition):
+                os.remove(os.path.join(partition, name))
+
+    @staticmethod
+    def _write_csv_atomic(df, path):
+        tmp_path = path + '.tmp'
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+def cached_impute_data(match_df, country=None, method='minmax', cache=None, return_fits=False, per_country=False):
+    """
+    `impute_data` backed by an ImputationCache. Without a country the frame is imputed
+    as a whole and cached in the 'combined' partition, giving the same result as
+    `impute_data`. With `per_country` set, a frame with several countries in a
+    'country_name' column is instead imputed per country, each country being its own
+    cache partition, so new data for one country only recomputes that country. Only
+    'drop' gives the same result either way: minmax and the trend methods then take
+    the non-league division and their fallbacks from each country's own divisions.
+
+    Returns:
+    - pd.DataFrame: Imputed data (and the fitted trends when `return_fits` is set).
+    """
+    cache = cache or ImputationCache()
+
+    if country is None and per_country:
+        if 'country_name' not in match_df:
+            raise ValueError("Imputing per country needs a 'country_name' column")
+        parts = [cached_impute_data(country_df, country_name, method, cache, return_fits=True)
+                 for country_name, country_df in match_df.groupby('country_name', sort=False)]
+        imputed_df = pd.concat([part for part, _ in parts])
+        imputed_df = imputed_df.loc[match_df.index[match_df.index.isin(imputed_df.index)]]
+        fits = [part_fits for _, part_fits in parts if part_fits is not None]
+        fits = pd.concat(fits, ignore_index=True) if fits else None
+        return (imputed_df, fits) if return_fits else imputed_df
+
+    country = country or 'combined'
+    fingerprint = data_fingerprint(match_df, method)
+    entry = cache.lookup(country, method, fingerprint)
+    if entry is not None:
+        imputed_df, fits = cache.load(match_df, country, entry)
+    else:
+        imputed_df, fits = impute_data_with_fits(match_df.copy(), method)
+        cache.store(match_df, imputed_df, fits, country, method, fingerprint)
+
+    return (imputed_df, fits) if return_fits else imputed_df
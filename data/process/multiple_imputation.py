@@ -0,0 +1,220 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from data.process.imputation import IMPUTE_COLUMNS, lower_tail_values, minmax_impute
+
+# Columns drawn per completed dataset; the other columns keep their minmax fill
+DRAW_COLUMNS = IMPUTE_COLUMNS
+MIN_VALUE_COLUMNS = ['team_size', 'foreigners', 'mean_value', 'total_value']
+
+
+class ImputedDatasets:
+    """
+    M completed datasets sharing one base frame. The base frame holds the observed
+    values and the deterministic minmax fill; per drawn column only the positions of
+    the imputed cells and an (n_cells, M) array of draws are kept, so the shared
+    columns are stored once instead of in M full copies.
+    """
+
+    def __init__(self, base, positions, draws):
+        self.base = base
+        self.positions = positions
+        self.draws = draws
+
+    @property
+    def m(self):
+        return next(iter(self.draws.values())).shape[1] if self.draws else 0
+
+    def dataset(self, i):
+        """
+        Materialize the i-th completed dataset. Only the drawn columns are copied.
+        """
+        frame = self.base.copy(deep=False)
+        for col, draws in self.draws.items():
+            values = self.base[col].to_numpy(dtype=float, copy=True)
+            values[self.positions[col]] = draws[:, i]
+            frame[col] = values
+        return frame
+
+    def __len__(self):
+        return self.m
+
+    def __iter__(self):
+        return (self.dataset(i) for i in range(self.m))
+
+
+def imputation_scale(match_df, col, imputed):
+    """
+    Standard deviation of the draws for the imputed cells of a column: non-league
+    teams vary like the lower tail of the lowest league division of their season (the
+    statistic minmax imputes them with), league teams with missing values like their
+    division in that season. Cells without a reference spread get the spread of the
+    lowest known division.
+    """
+    non_league_division = match_df['team_division'].max()
+    lowest_known_division = match_df['team_division'].min()
+    non_league_or_nan_teams = (match_df['team_division'] == non_league_division) | match_df['team_division'].isna()
+
+    scale = match_df.groupby(['year', 'team_division'])[col].transform('std')
+    if col in MIN_VALUE_COLUMNS:
+        lower_tail_std = {year: lower_tail_values(division_df, col).std()
+                          for year, division_df in match_df[match_df['team_division'] == non_league_division - 1]
+                          .groupby('year')}
+        scale[non_league_or_nan_teams] = match_df.loc[non_league_or_nan_teams, 'year'].map(lower_tail_std)
+
+    fallback = match_df.loc[match_df['team_division'] == lowest_known_division, col].std()
+    return scale[imputed].fillna(fallback).fillna(0).to_numpy(dtype=float)
+
+
+def bootstrap_rows(match_df, rng, strata=('year', 'team_division')):
+    """
+    Resample the rows of `match_df` with replacement within each stratum, so every
+    season and division keeps its size. Rows without a division are left out.
+    """
+    groups = match_df.groupby(list(strata)).indices.values()
+    rows = np.concatenate([rng.choice(group, len(group)) for group in groups])
+    return match_df.iloc[rows]
+
+
+def bootstrap_fill(match_df, sample):
+    """
+    Minmax fill of `match_df` with the fill parameters (the division means, the
+    lower-tail statistic of the lowest league division and the fallback) estimated on
+    `sample`, a bootstrap sample of its rows, instead of on the rows themselves.
+    """
+    return minmax_impute(match_df.copy(), sample).reset_index(drop=True)
+
+
+def lognormal_draws(center, scale, rng):
+    """
+    Draw every cell from a log-normal distribution with mean `center` and standard
+    deviation `scale` (per row). The draws stay positive without the upward bias a
+    normal truncated at zero has; cells with a zero center stay zero.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = np.log1p((scale[:, None] / center) ** 2)
+        draws = center * np.exp(np.sqrt(sigma2) * rng.standard_normal(center.shape) - sigma2 / 2)
+    return np.where(center > 0, draws, 0.0)
+
+
+def multiple_impute(match_df, m=20, columns=DRAW_COLUMNS, seed=0):
+    """
+    Stochastic minmax imputation: for every completed dataset the minmax fill
+    parameters are re-estimated on a bootstrap sample of the rows
+    (`bootstrap_fill`), the fills are scaled to average to the minmax fill per cell,
+    and every imputed cell of `columns` is drawn around its scaled fill with
+    `lognormal_draws`, with the spread given by `imputation_scale`. Redrawing the
+    parameters carries their uncertainty into the between-imputation variance, so
+    Rubin's rules apply; the lower-tail statistic non-league teams are filled with is
+    still a modelling choice rather than an estimate of their values, so for those
+    cells the pooled variance remains approximate.
+
+    Returns:
+    - ImputedDatasets: The M completed datasets.
+    """
+    rng = np.random.default_rng(seed)
+    base = minmax_impute(match_df.copy()).reset_index(drop=True)
+    observed = match_df.reset_index(drop=True)
+
+    # Minmax replaces the values of non-league teams in the min-value columns, observed or not
+    non_league_division = observed['team_division'].max()
+    non_league_or_nan_teams = (observed['team_division'] == non_league_division) | observed['team_division'].isna()
+
+    # With the rows themselves as the sample the fill must be the minmax fill the draws centre on
+    if not bootstrap_fill(observed, observed).equals(base):
+        raise AssertionError("Bootstrap fill of the unresampled rows differs from the minmax fill")
+
+    imputed, scales = {}, {}
+    for col in columns:
+        imputed[col] = observed[col].isna()
+        if col in MIN_VALUE_COLUMNS:
+            imputed[col] |= non_league_or_nan_teams
+        scales[col] = imputation_scale(observed, col, imputed[col])
+
+    centers = {col: np.empty((imputed[col].sum(), m)) for col in columns}
+    for i in range(m):
+        fill = bootstrap_fill(observed, bootstrap_rows(observed, rng))
+        for col in columns:
+            centers[col][:, i] = fill.loc[imputed[col], col].to_numpy(dtype=float)
+
+    positions, draws = {}, {}
+    for col in columns:
+        # Scale the bootstrap fills so that per cell they average to the minmax fill. A lower tail
+        # of a single team falls back to the lowest division's mean, so resamples that repeat or
+        # drop that team jump between both statistics and would not be centred on the fill
+        base_center = base.loc[imputed[col], col].to_numpy(dtype=float)
+        mean_fill = centers[col].mean(axis=1)
+        shift = np.divide(base_center, mean_fill, out=np.ones_like(base_center), where=mean_fill > 0)
+        positions[col] = np.flatnonzero(imputed[col].to_numpy())
+        draws[col] = lognormal_draws(centers[col] * shift[:, None], scales[col], rng)
+
+    return ImputedDatasets(base, positions, draws)
+
+
+_worker_datasets = None
+
+
+def _init_worker(datasets):
+    global _worker_datasets
+    _worker_datasets = datasets
+
+
+def _estimate(i, estimator):
+    return pd.DataFrame(estimator(_worker_datasets.dataset(i))).assign(imputation=i)
+
+
+def estimate_imputed(datasets, estimator, workers=None):
+    """
+    Run `estimator` on every completed dataset. With more than one worker the datasets
+    are estimated in a process pool; each worker receives the shared base frame and the
+    draws once and materializes its datasets itself. `estimator` must be picklable (a
+    module-level function or a functools.partial of one) and return rows of estimates.
+
+    Returns:
+    - pd.DataFrame: The estimates of all datasets, with an 'imputation' column.
+    """
+    if workers == 1:
+        _init_worker(datasets)
+        estimates = [_estimate(i, estimator) for i in range(datasets.m)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(datasets,)) as executor:
+            estimates = list(executor.map(_estimate, range(datasets.m), [estimator] * datasets.m))
+    return pd.concat(estimates, ignore_index=True)
+
+
+def pool_rubin(estimates, keys, estimate_col='estimate', se_col='std_error'):
+    """
+    Pool the estimates of M completed datasets per `keys` with Rubin's rules: the
+    pooled estimate is the mean estimate and its variance T = W + (1 + 1/M) B adds the
+    between-imputation variance B to the mean within-imputation variance W. Tests use
+    a t distribution with Rubin's degrees of freedom.
+
+    Returns:
+    - pd.DataFrame: Per key the pooled estimate, std_error, degrees of freedom, p_value
+      and the fraction of missing information.
+    """
+    grouped = estimates.assign(variance=estimates[se_col] ** 2).groupby(list(keys))
+    m = grouped[estimate_col].count()
+    estimate = grouped[estimate_col].mean()
+    within = grouped['variance'].mean()
+    between = grouped[estimate_col].var(ddof=1).fillna(0)
+
+    total = within + (1 + 1 / m) * between
+    relative_increase = (1 + 1 / m) * between / within  # Relative increase in variance due to nonresponse
+    with np.errstate(divide='ignore'):
+        df = (m - 1) * (1 + 1 / relative_increase) ** 2
+    std_error = np.sqrt(total)
+    p_value = 2 * stats.t.sf(np.abs(estimate / std_error), df)
+    missing_information = (relative_increase + 2 / (df + 3)) / (1 + relative_increase)
+
+    return pd.DataFrame({
+        estimate_col: estimate,
+        se_col: std_error,
+        'df': df,
+        'p_value': p_value,
+        'missing_information': missing_information,
+        'imputations': m,
+    }).reset_index()
@@ -4,6 +4,12 @@ import pandas as pd
 from datetime import timedelta
 
 from utils.load import project_root, load_csv
+from data.distance.loader import pair_keys, resolve_distances, resolve_team_coordinates
+from data.distance.pool import GeocoderPool
+from data.distance.spatial import add_spatial_features
+from data.process.registry import update_team_registry
+
+KEY_COLUMNS = ('team_key', 'opponent_key')
 
 
 def set_non_league_rank(team_data: pd.DataFrame, divisions: int = 4):
@@ -199,66 +205,68 @@ def merge_with_next_fixture_data(cup_fixtures, league_fixtures):
     return merged_cup_fixtures
 
 
-def merge_with_distance_data(cup_fixtures, distance_data):
+def merge_with_distance_data(cup_fixtures, distance_data, registry):
     """
     Merge cup fixtures dataframe with distance data, adding travel distance
-    information for away matches.
+    information for away matches. Distance data is keyed by team names, which are
+    resolved to registry keys first so fixtures are joined on integer keys.
 
     Returns:
     - pd.DataFrame: Merged dataframe with distance data.
     """
     cup_fixtures['distance'] = 0
-    away_matches = cup_fixtures[cup_fixtures['team_home'] == 'away'].copy()
-
-    distance_dict = {}
-    for index, row in distance_data.iterrows():
-        team1, team2, distance = row['team_name'], row['opponent_name'], row['distance']
-        distance_dict[(team1, team2)] = distance
-        distance_dict[(team2, team1)] = distance
+    away_matches = cup_fixtures['team_home'] == 'away'
 
-    def lookup_distance(row):
-        team = row['team_name']
-        opponent = row['opponent_name']
-        return distance_dict.get((team, opponent), None)
+    distance_data = (registry.keys_for_names(distance_data[['team_name', 'opponent_name', 'distance']],
+                                             ['team_name', 'opponent_name'])
+                     .rename(columns={'team_name_key': 'team_key', 'opponent_name_key': 'opponent_key'}))
+    distances = pd.Series(distance_data['distance'].to_numpy(), index=pair_keys(distance_data, KEY_COLUMNS))
+    distances = distances[~distances.index.duplicated(keep='last')]
 
-    away_matches['distance'] = away_matches.apply(lookup_distance, axis=1)
-    cup_fixtures.loc[away_matches.index, 'distance'] = away_matches['distance']
+    away_keys = pair_keys(cup_fixtures[away_matches], KEY_COLUMNS)
+    cup_fixtures.loc[away_matches, 'distance'] = distances.reindex(away_keys).to_numpy()
 
     return cup_fixtures
 
 
-def merge_with_financial_data(cup_fixtures, financial_data, team_mapping):
+def merge_with_spatial_features(cup_fixtures, coordinates):
+    """
+    Add location controls (distance to the nearest professional clubs, local-derby
+    flag and regional cluster) computed from cached team coordinates.
+
+    Returns:
+    - pd.DataFrame: Merged dataframe with spatial features.
+    """
+    return add_spatial_features(cup_fixtures, coordinates)
+
+
+def merge_with_financial_data(cup_fixtures, financial_data, registry):
     """
-    Merge cup fixtures dataframe with financial data using a custom mapping
-    of team names. Custom mappings can be found in settings folder.
+    Merge cup fixtures dataframe with financial data on registry keys. The registry
+    links every club to its Transfermarkt name through the custom mappings in the
+    settings folder, and adds the club's city.
 
     Returns:
     - pd.DataFrame: Merged dataframe with financial data.
     """
-    cup_fixtures = cup_fixtures.merge(
-        team_mapping,
-        left_on='team_name',
-        right_on='cup_name',
-        how='left'
-    )
+    cup_fixtures['city'] = cup_fixtures['team_key'].map(registry.teams['city'])
 
-    cup_fixtures.drop(columns=['cup_name'], inplace=True)
+    financial_data = (financial_data
+                      .merge(registry.financial_names(), left_on='team_name', right_on='financial_name')
+                      .drop(columns=['team_name', 'financial_name']))
 
     merged_cup_fixtures = pd.merge(
         cup_fixtures,
         financial_data,
-        left_on=['year', 'financial_name'],
-        right_on=['year', 'team_name'],
+        on=['year', 'team_key'],
         how='left',
         suffixes=('', '_fin')
     )
 
-    merged_cup_fixtures.drop(columns=['financial_name', 'team_name_fin'], inplace=True)
-
     return merged_cup_fixtures
 
 
-def preprocess_data(country: str, cup: str):
+def preprocess_data(country: str, cup: str, distance_backends=('gazetteer',)):
     """
     Preprocess the data for a given country and cup by merging and enhancing data
     from various sources including cup fixtures, league standings, next fixtures,
@@ -270,14 +278,18 @@ def preprocess_data(country: str, cup: str):
     cup_fixtures = load_csv(os.path.join(project_root(), 'data', 'process', country, f'{cup}_fixtures.csv'))
     league_standings = load_csv(os.path.join(project_root(), 'data', 'process', country, 'league_standings.csv'))
     league_fixtures = load_csv(os.path.join(project_root(), 'data', 'process', country, 'league_fixtures.csv'))
-    distance_data = load_csv(os.path.join(project_root(), 'data', 'process', country, f'{cup}_distance_data.csv'))
     financial_data = load_csv(os.path.join(project_root(), 'data', 'process', country, f'{cup}_financial_data.csv'))
-    team_mapping = load_csv(os.path.join(project_root(), 'settings', country, f'{cup}_team_mapping.csv'))
+    team_coordinates = resolve_team_coordinates(country, cup)
+    registry = update_team_registry(country, cup, team_coordinates)
+    cup_fixtures = registry.add_keys(cup_fixtures)
 
     merged_cup_fixtures = merge_cup_and_league_data(cup_fixtures, league_standings)
     merged_cup_fixtures = merge_with_next_fixture_data(merged_cup_fixtures, league_fixtures)
-    merged_cup_fixtures = merge_with_distance_data(merged_cup_fixtures, distance_data)
-    merged_cup_fixtures = merge_with_financial_data(merged_cup_fixtures, financial_data, team_mapping)
+    distance_data = resolve_distances(merged_cup_fixtures, country, cup,
+                                      GeocoderPool.from_config(country, distance_backends))
+    merged_cup_fixtures = merge_with_distance_data(merged_cup_fixtures, distance_data, registry)
+    merged_cup_fixtures = merge_with_spatial_features(merged_cup_fixtures, team_coordinates)
+    merged_cup_fixtures = merge_with_financial_data(merged_cup_fixtures, financial_data, registry)
 
     merged_cup_fixtures['team_home'] = merged_cup_fixtures['team_home'].apply(lambda x: 1 if x == 'home' else 0)
     merged_cup_fixtures['extra_time'] = merged_cup_fixtures['fixture_length'].apply(lambda x: 1 if x > 90 else 0)
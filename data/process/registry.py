@@ -0,0 +1,180 @@
+import os
+import pandas as pd
+
+from utils.load import project_root, load_csv
+
+REGISTRY_COLUMNS = ['team_key', 'team_id', 'team_name', 'financial_name', 'city', 'latitude', 'longitude', 'aliases']
+ALIAS_SEPARATOR = '|'
+
+
+def registry_path(country):
+    return os.path.join(project_root(), 'data', 'process', country, 'team_registry.csv')
+
+
+class TeamRegistry:
+    """
+    Cross-source identity of the clubs of a country. Every club has a stable integer
+    `team_key` with its api-sports `team_id`, its Transfermarkt `financial_name`, city
+    coordinates and the names it appears under in the other sources (`aliases`).
+
+    Lookups are indexed, so sources can be joined on `team_key` instead of on names.
+    """
+
+    def __init__(self, teams):
+        self.teams = teams.set_index('team_key', drop=False)
+        self.team_keys = pd.Series(self.teams['team_key'].to_numpy(), index=self.teams['team_id'].to_numpy())
+
+        names = self.teams[['team_key', 'team_name', 'aliases']].copy()
+        names['name'] = names['team_name'] + ALIAS_SEPARATOR + names['aliases'].fillna('')
+        names['name'] = names['name'].str.split(ALIAS_SEPARATOR)
+        self.names = (names.explode('name')[['name', 'team_key']]
+                      .query('name != ""')
+                      .drop_duplicates()
+                      .reset_index(drop=True))
+
+    def lookup(self, team_key):
+        return self.teams.loc[team_key]
+
+    def keys_for_ids(self, team_ids):
+        return team_ids.map(self.team_keys).astype('Int64')
+
+    def add_keys(self, fixtures):
+        """
+        Add `team_key` and `opponent_key` columns to fixtures with api-sports ids.
+        """
+        fixtures['team_key'] = self.keys_for_ids(fixtures['team_id'])
+        fixtures['opponent_key'] = self.keys_for_ids(fixtures['opponent_id'])
+        return fixtures
+
+    def keys_for_names(self, df, columns):
+        """
+        Replace name columns by the keys of the clubs known under those names. A name
+        shared by several clubs yields a row per club.
+
+        Returns:
+        - pd.DataFrame: `df` with a '<column>_key' column in place of every name column.
+        """
+        for column in columns:
+            df = (df.merge(self.names.rename(columns={'name': column, 'team_key': f'{column}_key'}),
+                           on=column, how='inner')
+                  .drop(columns=[column]))
+        return df
+
+    def financial_names(self):
+        return self.teams.loc[self.teams['financial_name'].notna(), ['team_key', 'financial_name']] \
+            .reset_index(drop=True)
+
+
+def load_team_registry(country):
+    path = registry_path(country)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=REGISTRY_COLUMNS)
+    return pd.read_csv(path, keep_default_na=False, na_values=[''])
+
+
+def save_team_registry(teams, country):
+    save_path = registry_path(country)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    tmp_path = save_path + '.tmp'
+    teams[REGISTRY_COLUMNS].to_csv(tmp_path, index=False)
+    os.replace(tmp_path, save_path)
+
+
+def source_team_names(country, cup):
+    """
+    Collect every (team_id, team_name, year) the api-sports sources of a country use,
+    flagging the names used in the cup fixtures.
+    """
+    process_path = os.path.join(project_root(), 'data', 'process', country)
+    cup_fixtures = load_csv(os.path.join(process_path, f'{cup}_fixtures.csv'))
+    league_standings = load_csv(os.path.join(process_path, 'league_standings.csv'))
+
+    columns = ['team_id', 'team_name', 'year']
+    names = pd.concat([
+        cup_fixtures[columns].assign(is_cup=True),
+        cup_fixtures[['opponent_id', 'opponent_name', 'year']].set_axis(columns, axis=1).assign(is_cup=True),
+        league_standings[columns].assign(is_cup=False),
+    ], ignore_index=True)
+    return names.dropna(subset=['team_id']).astype({'team_id': int})
+
+
+def update_team_registry(country, cup, coordinates=None):
+    """
+    Update the team registry of a country from the cup fixtures, league standings,
+    the hand-curated team mapping and, if given, resolved team coordinates. Clubs keep
+    their key across updates; clubs seen for the first time get the next free keys in
+    order of their api-sports id. A club's name is its most recent cup name (or league
+    name), and its financial name and city come from the first of its names that is in
+    the team mapping.
+
+    Returns:
+    - TeamRegistry: Updated registry, also saved to `data/process/<country>/team_registry.csv`.
+    """
+    names = source_team_names(country, cup)
+    registry = load_team_registry(country)
+
+    # Cup names take precedence, then the most recent season
+    names = names.sort_values(by=['team_id', 'is_cup', 'year'], ascending=[True, False, False], kind='stable')
+    primary = names.drop_duplicates(subset=['team_id'])[['team_id', 'team_name']]
+
+    known_aliases = registry.set_index('team_id')['aliases'].dropna().astype(str).str.split(ALIAS_SEPARATOR).explode() \
+        if len(registry) else pd.Series(dtype=object)
+    aliases = (pd.concat([names[['team_id', 'team_name']],
+                          known_aliases.rename('team_name').rename_axis('team_id').reset_index()])
+               .drop_duplicates()
+               .merge(primary, on='team_id', suffixes=('', '_primary')))
+    aliases = aliases[aliases['team_name'] != aliases['team_name_primary']]
+    aliases = aliases.groupby('team_id')['team_name'].agg(lambda values: ALIAS_SEPARATOR.join(sorted(values)))
+
+    teams = primary.assign(aliases=primary['team_id'].map(aliases))
+
+    # Stable keys: known clubs keep theirs, new clubs are numbered after the highest key
+    keys = registry.set_index('team_id')['team_key']
+    teams['team_key'] = teams['team_id'].map(keys)
+    new_clubs = teams['team_key'].isna()
+    next_key = int(keys.max()) + 1 if len(keys) else 1
+    teams.loc[new_clubs, 'team_key'] = range(next_key, next_key + new_clubs.sum())
+    teams['team_key'] = teams['team_key'].astype(int)
+
+    # Financial name and city from the curated mapping, matched on any of the club's names
+    mapping = load_csv(os.path.join(project_root(), 'settings', country, f'{cup}_team_mapping.csv'))
+    mapping['financial_name'] = mapping['financial_name'].replace('None', pd.NA)
+    club_names = names[['team_id', 'team_name']].drop_duplicates()
+    primary_names = club_names['team_id'].map(primary.set_index('team_id')['team_name'])
+    club_names['is_primary'] = club_names['team_name'] == primary_names
+    mapped = (club_names.merge(mapping, left_on='team_name', right_on='cup_name')
+              .sort_values(by=['team_id', 'is_primary'], ascending=[True, False], kind='stable')
+              .drop_duplicates(subset=['team_id'])
+              .set_index('team_id'))
+    teams['financial_name'] = teams['team_id'].map(mapped['financial_name'])
+    teams['city'] = teams['team_id'].map(mapped['city'])
+
+    teams['latitude'] = teams['longitude'] = float('nan')
+    if coordinates is not None:
+        located = (club_names.merge(coordinates, on='team_name')
+                   .sort_values(by=['team_id', 'is_primary'], ascending=[True, False], kind='stable')
+                   .drop_duplicates(subset=['team_id'])
+                   .set_index('team_id'))
+        teams['latitude'] = teams['team_id'].map(located['latitude'])
+        teams['longitude'] = teams['team_id'].map(located['longitude'])
+    elif len(registry):
+        teams['latitude'] = teams['team_id'].map(registry.set_index('team_id')['latitude'])
+        teams['longitude'] = teams['team_id'].map(registry.set_index('team_id')['longitude'])
+
+    # Keep clubs that dropped out of the sources so their keys are never reused
+    dropped = registry[~registry['team_id'].isin(teams['team_id'])]
+    teams = (pd.concat([teams[REGISTRY_COLUMNS], dropped[REGISTRY_COLUMNS]], ignore_index=True)
+             .astype({'team_key': int, 'team_id': int})
+             .sort_values(by='team_key')
+             .reset_index(drop=True))
+
+    save_team_registry(teams, country)
+    return TeamRegistry(teams)
+
+
+if __name__ == "__main__":
+    country = 'Germany'
+    cup = 'DFB_Pokal'
+    registry = update_team_registry(country, cup)
+
+    print(registry.teams)
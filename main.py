@@ -1,5 +1,4 @@
 import sys
-import os
 import logging
 
 from data.raw.loader import request_raw_data
@@ -25,27 +24,29 @@ def run_preprocess_data(country, cup):
     logging.info(f"Analyzing league data for {country}...")
     construct_league_data(country)
 
-    financial_data_path = os.path.join('data', 'process', country, f'{cup}_financial_data.csv')
-    if not os.path.exists(financial_data_path):
-        logging.info("Loading financial data...")
-        request_financial_data(country)
+    logging.info("Updating financial data for missing league seasons...")
+    request_financial_data(country, cup)
 
-    distance_data_path = os.path.join('data', 'process', country, f'{cup}_distance_data.csv')
-    if not os.path.exists(distance_data_path):
-        logging.info(f"Calculating distances for {cup} in {country}...")
-        request_distance_data(country, cup)
+    logging.info(f"Resolving distances for new away fixtures of {cup} in {country}...")
+    request_distance_data(country, cup)
 
     logging.info("Preprocessing all data...")
     preprocess_data(country, cup)
     logging.info("Data processing is finished.")
 
 
+def run_parse_financial_data(country, cup):
+    logging.info(f"Rebuilding financial data for {cup} from cached pages...")
+    request_financial_data(country, cup, offline=True)
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python main.py <command> [options]")
         print("Commands:")
         print("  request_raw_data <country>")
         print("  preprocess_data <country> <cup>")
+        print("  parse_financial_data <country> <cup>")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -63,12 +64,20 @@ def main():
         country = sys.argv[2]
         cup = sys.argv[3]
         run_preprocess_data(country, cup)
+    elif command == "run_parse_financial_data":
+        if len(sys.argv) != 4:
+            print("Usage: python main.py parse_financial_data <country> <cup>")
+            sys.exit(1)
+        country = sys.argv[2]
+        cup = sys.argv[3]
+        run_parse_financial_data(country, cup)
     else:
         print(f"Unknown command: {command}")
         print("Usage: python main.py <command> [options]")
         print("Commands:")
         print("  request_raw_data <country>")
         print("  preprocess_data <country> <cup>")
+        print("  parse_financial_data <country> <cup>")
         sys.exit(1)
 
 
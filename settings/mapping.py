@@ -1,8 +1,17 @@
 import os
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
 import pandas as pd
-import Levenshtein
+from rapidfuzz import process, fuzz
 from utils.load import project_root, load_csv
 
+# Club-type affixes that carry no identity, e.g. 'FC' in '1.FC Köln' or 'SC' in 'SC Braga'
+CLUB_AFFIXES = {'fc', 'afc', 'cf', 'sc', 'sv', 'ssv', 'tsv', 'vfl', 'vfb', 'tsg', 'cd', 'gd', 'ud', 'sl', 'ad', 'sd',
+                'ac', 'cs', 'sg', 'bv', 'fk', 'spvgg', 'club', 'clube', 'futebol', 'de', 'do', 'da'}
+
 
 def extract_unique_team_names(country: str, cup: str):
     # Load cup fixtures and financial data
@@ -16,31 +25,188 @@ def extract_unique_team_names(country: str, cup: str):
     return unique_cup_teams, unique_financial_teams
 
 
+def normalize_team_name(name):
+    """
+    Normalize a team name for candidate generation: strip diacritics and punctuation,
+    lowercase, and drop club-type affixes such as FC, SV, SC or AFC. Names made up of
+    affixes only keep their tokens.
+    """
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(char for char in name if not unicodedata.combining(char)).lower()
+    tokens = re.sub(r'[^a-z0-9]+', ' ', name).split()
+    tokens = [token for token in tokens if not token.isdigit() or len(token) > 1]
+    stripped = [token for token in tokens if token not in CLUB_AFFIXES]
+    return ' '.join(stripped or tokens)
+
+
+class NgramIndex:
+    """
+    Inverted index from character n-grams of normalized names to the names containing
+    them, including n-grams of the initials of multi-word names. `candidates` ranks
+    names by the Dice overlap of their n-gram sets with the query and returns the best
+    `limit`, so exact scoring only runs on a small block instead of on all pairs.
+    """
+
+    def __init__(self, names, n=3):
+        self.names = list(names)
+        self.n = n
+        postings = defaultdict(list)
+        self.sizes = np.zeros(len(self.names))
+        for position, name in enumerate(self.names):
+            grams = self.ngrams(name)
+            self.sizes[position] = len(grams)
+            for gram in grams:
+                postings[gram].append(position)
+        self.postings = {gram: np.array(positions) for gram, positions in postings.items()}
+
+    def ngrams(self, name):
+        normalized = normalize_team_name(name)
+        tokens = normalized.split()
+        grams = set()
+        # Index the initials of multi-word names too, so abbreviations like 'QPR' find their club
+        for text in [normalized] + ([''.join(token[0] for token in tokens)] if len(tokens) > 1 else []):
+            padded = f' {text} '
+            grams.update(padded[i:i + self.n] for i in range(max(len(padded) - self.n + 1, 1)))
+        return grams
+
+    def candidates(self, name, limit=20):
+        """
+        Returns:
+        - np.ndarray: Positions in `names` of up to `limit` candidates sharing at least one n-gram, best first.
+        """
+        grams = self.ngrams(name)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return np.array([], dtype=int)
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        overlap = 2 * shared / (len(grams) + self.sizes)
+        matched = np.flatnonzero(shared)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-overlap[matched], limit - 1)[:limit]]
+        return matched[np.argsort(-overlap[matched], kind='stable')]
+
+
+def match_team_names(queries, choices, k=3, scorer=fuzz.ratio, workers=-1, block=None):
+    """
+    Score every query against every choice in one batched call and keep the top-k
+    choices per query. Scores are scaled to [0, 1]; with the default scorer they equal
+    `Levenshtein.ratio`. Ties keep the choice that comes first in `choices`.
+
+    With `block` set, each query is only scored against the `block` candidates an
+    NgramIndex over the choices returns for it, which keeps matching linear in the
+    number of names; queries may then get fewer than k rows.
+
+    Returns:
+    - pd.DataFrame: Columns ['cup_team_name', 'rank', 'financial_team_name', 'match_ratio'],
+      with k rows per query ordered by rank.
+    """
+    queries, choices = list(queries), list(choices)
+    if block is not None:
+        return match_blocked_team_names(queries, choices, k, scorer, NgramIndex(choices), block)
+
+    k = min(k, len(choices))
+    scores = process.cdist(queries, choices, scorer=scorer, dtype=np.float64, workers=workers) / 100
+
+    # Select the k best columns per row, then order them by score and original position
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < len(choices) \
+        else np.tile(np.arange(len(choices)), (len(queries), 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    return pd.DataFrame({
+        'cup_team_name': np.repeat(queries, k),
+        'rank': np.tile(np.arange(1, k + 1), len(queries)),
+        'financial_team_name': np.asarray(choices, dtype=object)[candidates.ravel()],
+        'match_ratio': candidate_scores.ravel().astype(float)
+    })
+
+
+def match_blocked_team_names(queries, choices, k, scorer, index, block):
+    rows = []
+    for query in queries:
+        # Score candidates in their original order so ties resolve as in the full matrix
+        candidates = np.sort(index.candidates(query, block))
+        matches = process.extract(query, [choices[position] for position in candidates], scorer=scorer, limit=k)
+        rows.extend((query, rank, choice, score / 100) for rank, (choice, score, _) in enumerate(matches, start=1))
+
+    return pd.DataFrame(rows, columns=['cup_team_name', 'rank', 'financial_team_name', 'match_ratio'])
+
+
+def blocking_recall(country: str, cup: str, block=20):
+    """
+    Check candidate generation against the hand-curated team mapping: the share of
+    curated financial names that are in the candidate block of their cup name, and
+    the share that ends up as the best blocked match. Cup teams mapped to 'None' have
+    no financial data and are skipped.
+
+    Returns:
+    - dict: Recall, top-1 accuracy and the average fraction of pairs that is scored.
+    """
+    _, unique_financial_teams = extract_unique_team_names(country, cup)
+    choices = list(unique_financial_teams)
+    positions = {name: position for position, name in enumerate(choices)}
+
+    mapping = pd.read_csv(os.path.join(project_root(), 'settings', country, f'{cup}_team_mapping.csv'),
+                          encoding='utf-8-sig')
+    mapping = mapping[mapping['financial_name'].isin(positions)]
+
+    index = NgramIndex(choices)
+    blocks = [index.candidates(name, block) for name in mapping['cup_name']]
+    in_block = [positions[financial_name] in candidates
+                for financial_name, candidates in zip(mapping['financial_name'], blocks)]
+
+    best = match_blocked_team_names(list(mapping['cup_name']), choices, 1, fuzz.ratio, index, block)
+    best = mapping.merge(best, left_on='cup_name', right_on='cup_team_name', how='left')
+
+    return {
+        'country': country,
+        'pairs': len(mapping),
+        'recall': float(np.mean(in_block)),
+        'top1_accuracy': float((best['financial_name'] == best['financial_team_name']).mean()),
+        'scored_fraction': float(np.mean([len(candidates) for candidates in blocks]) / len(choices)),
+    }
+
+
 def generate_team_mapping(unique_cup_teams, unique_financial_teams):
     """
     Generate a mapping between cup team names and financial team names based on Levenshtein distance.
     Returns a DataFrame with columns: ['cup_team_name', 'financial_team_name', 'match_ratio'].
     """
-    mapping_results = []
+    matches = match_team_names(unique_cup_teams, unique_financial_teams, k=1)
+    return matches.drop(columns=['rank'])
 
-    for cup_team in unique_cup_teams:
-        best_match = None
-        best_score = 0
 
-        for fin_team in unique_financial_teams:
-            score = Levenshtein.ratio(cup_team, fin_team)
-            if score > best_score:
-                best_match = fin_team
-                best_score = score
+def draft_team_mapping(country: str, cup: str, k=3):
+    """
+    Draft `settings/<country>/<cup>_team_mapping.csv` rows for cup teams that are not
+    mapped yet. Each row proposes the best financial name and lists the runner-up
+    candidates with their scores for review; cities are left to be filled in by hand.
 
-        mapping_results.append({
-            'cup_team_name': cup_team,
-            'financial_team_name': best_match,
-            'match_ratio': best_score
-        })
+    Returns:
+    - pd.DataFrame: Draft rows with columns ['cup_name', 'financial_name', 'city', 'match_ratio', 'candidates'].
+    """
+    unique_cup_teams, unique_financial_teams = extract_unique_team_names(country, cup)
 
-    mapping_df = pd.DataFrame(mapping_results)
-    return mapping_df
+    mapping_file = os.path.join(project_root(), 'settings', country, f'{cup}_team_mapping.csv')
+    if os.path.exists(mapping_file):
+        mapped = set(pd.read_csv(mapping_file, encoding='utf-8-sig')['cup_name'])
+        unique_cup_teams = [team for team in unique_cup_teams if team not in mapped]
+    if not len(unique_cup_teams):
+        return pd.DataFrame(columns=['cup_name', 'financial_name', 'city', 'match_ratio', 'candidates'])
+
+    matches = match_team_names(unique_cup_teams, unique_financial_teams, k=k)
+    matches['candidate'] = matches['financial_team_name'] + ' (' + matches['match_ratio'].round(2).astype(str) + ')'
+    runners_up = matches[matches['rank'] > 1].groupby('cup_team_name', sort=False)['candidate'].agg('; '.join)
+
+    draft = matches[matches['rank'] == 1].rename(columns={'cup_team_name': 'cup_name',
+                                                          'financial_team_name': 'financial_name'})
+    draft = draft[['cup_name', 'financial_name', 'match_ratio']].reset_index(drop=True)
+    draft.insert(2, 'city', '')
+    draft['candidates'] = draft['cup_name'].map(runners_up).fillna('')
+    return draft.sort_values('match_ratio').reset_index(drop=True)
 
 
 if __name__ == "__main__":
@@ -59,4 +225,11 @@ if __name__ == "__main__":
     team_mapping_df = generate_team_mapping(unique_cup_teams, unique_financial_teams)
 
     print("\nGenerated Team Mapping:")
-    print(team_mapping_df)
\ No newline at end of file
+    print(team_mapping_df)
+
+    # Draft rows for cup teams missing from the hand-curated mapping
+    print("\nDraft Team Mapping:")
+    print(draft_team_mapping(country, cup))
+
+    # Recall of the n-gram candidate blocks against the curated mapping
+    print(blocking_recall(country, cup))
\ No newline at end of file
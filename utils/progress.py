@@ -0,0 +1,43 @@
+import sys
+import time
+
+
+class ProgressBar:
+    """
+    Minimal text progress bar, redrawn in place on a terminal stream.
+    """
+
+    def __init__(self, total, description='', width=40, stream=None, enabled=True):
+        self.total = total
+        self.description = description
+        self.width = width
+        self.stream = stream or sys.stderr
+        self.enabled = enabled
+        self.count = 0
+        self.start = time.monotonic()
+        self._draw()
+
+    def update(self, n=1):
+        self.count += n
+        self._draw()
+
+    def _draw(self):
+        if not self.enabled:
+            return
+        fraction = self.count / self.total if self.total else 1.0
+        filled = int(self.width * fraction)
+        elapsed = time.monotonic() - self.start
+        self.stream.write(f'\r{self.description} |{"#" * filled}{" " * (self.width - filled)}| '
+                          f'{self.count}/{self.total} [{elapsed:.1f}s]')
+        self.stream.flush()
+
+    def close(self):
+        if self.enabled:
+            self.stream.write('\n')
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
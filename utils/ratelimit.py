@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` acquisitions per second on average,
+    with bursts of up to `burst` acquisitions. A rate of None disables limiting.
+    """
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        if self.rate is None:
+            return
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Take a token without blocking; returns False when the rate is exceeded.
+        """
+        if self.rate is None:
+            return True
+
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def penalize(self, seconds):
+        """
+        Drain the bucket and block further acquisitions for `seconds`, e.g. after a
+        rate-limit response from the server.
+        """
+        if self.rate is None:
+            return
+
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
@@ -0,0 +1,51 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays:
+    """
+    NumPy arrays copied once into shared memory blocks, so worker processes can map them
+    instead of receiving a pickled copy each. `spec` is the small picklable description
+    the workers pass to `attach_arrays`. The blocks are released when the context exits.
+    """
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_arrays(spec):
+    """
+    Map the arrays of a SharedArrays `spec` in a worker process.
+
+    Returns:
+    - tuple: (dict of read-only arrays, list of the shared memory blocks, which must stay
+      referenced while the arrays are used)
+    """
+    arrays, blocks = {}, []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+        blocks.append(block)
+    return arrays, blocks